@@ -0,0 +1,273 @@
+import inspect
+import io
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import timeit
+from datetime import datetime
+from random import Random
+
+import numpy as np
+
+import engine
+from docopt import docopt
+from engine import generate_candidates, generate_voters, is_condorcet_winner, run_all_simulations_per_seed, \
+    run_simulation
+from helper import permute_identityless
+from ntu.votes.profilepreference import SinglePeakedProfilePreference
+from ntu.votes.tiebreaking import LexicographicTieBreakingRule
+from ntu.votes.utility import BordaUtility
+from ntu.votes.voter import Status
+
+__doc__ = """
+Benchmarks of the simulation core, over a grid of candidates and voters numbers.
+
+Every benchmark is timed on every cell of the grid, and its best time per call (over several repeats) is compared to
+the stored baseline. Micro benchmarks time one call per voter (or candidate) of a fixed random single-peaked borda
+profile; macro benchmarks time a whole simulation.
+
+The baseline file keeps several labelled baselines, e.g. 'before' and 'current'. Benchmarks only use what the first
+commit of the engine has as well (or are skipped without it), so bench.py can be copied into a checkout of an older
+commit and run there with --save --label to record its numbers.
+"""
+
+# Placements are enumerated (not counted) by permute_identityless(); larger cells are skipped. Bounded by the number of
+# multisets of bins, mirrors included.
+MAX_PERMUTE_PLACEMENTS = 200_000
+
+# run_simulation() summarizes scenarios instead of keeping their trajectory, since it can
+SUMMARY = {'trajectory': False} if 'trajectory' in inspect.signature(run_simulation).parameters else {}
+
+
+class Profile:
+    """A random single-peaked borda profile, as built by engine.run_all_simulations_per_seed()"""
+
+    def __init__(self, n_candidates: int, n_voters: int, seed: int = 0):
+        rand = Random(seed)
+        self.utility = BordaUtility()
+        self.all_candidates = generate_candidates(n_candidates, False, rand)
+        # older checkouts rank candidates without a priority table
+        self.tie_breaking_rule = LexicographicTieBreakingRule(self.all_candidates) \
+            if inspect.signature(LexicographicTieBreakingRule).parameters else LexicographicTieBreakingRule()
+        self.all_voters = generate_voters(n_voters, 'general', self.utility, rand)
+        for voter in self.all_voters:
+            voter.build_profile(self.all_candidates, SinglePeakedProfilePreference())
+        self.profile = [voter.getprofile() for voter in self.all_voters]
+        self.status = Status.from_profile(self.profile)
+
+    def reset(self) -> Status:
+        """Truthful ballots again, for a simulation to start from scratch. run_simulation() moves them."""
+        for voter in self.all_voters:
+            voter.most_recent_vote = voter.get_truthful_vote()
+        return Status.from_profile(self.profile)
+
+
+def bench_in_order(profile: Profile, n_candidates: int, n_voters: int):
+    status = profile.status
+    return status.in_order
+
+
+def bench_propose_enhancement(profile: Profile, n_candidates: int, n_voters: int):
+    ballots = [voter.most_recent_vote for voter in profile.all_voters]
+
+    def run():
+        # A voter that can improve moves its ballot: every call starts again from the same ballots
+        for voter, ballot in zip(profile.all_voters, ballots):
+            voter.most_recent_vote = ballot
+            voter.propose_enhancement(profile.status, profile.tie_breaking_rule)
+    return run
+
+
+def bench_total_utility(profile: Profile, n_candidates: int, n_voters: int):
+    def run():
+        for voter in profile.all_voters:
+            profile.utility.total_utility(voter.profile, profile.status.toppers, profile.tie_breaking_rule)
+    return run
+
+
+def bench_is_condorcet_winner(profile: Profile, n_candidates: int, n_voters: int):
+    # whether every candidate is a weak and a strong Condorcet winner, as condorcet_winners() finds them at once
+    return lambda: [(is_condorcet_winner(profile.profile, candidate), is_condorcet_winner(profile.profile, candidate,
+                                                                                          False))
+                    for candidate in profile.all_candidates]
+
+
+def bench_condorcet_winners(profile: Profile, n_candidates: int, n_voters: int):
+    if not hasattr(engine, 'condorcet_winners'):
+        return None
+    return lambda: engine.condorcet_winners(profile.profile)
+
+
+def bench_permute_identityless(profile: Profile, n_candidates: int, n_voters: int):
+    bin_names = list(range(2 * n_candidates))
+    if math.comb(len(bin_names) + n_voters - 1, n_voters) > MAX_PERMUTE_PLACEMENTS:
+        return None
+    return lambda: permute_identityless(bin_names, n_voters, ret=list())
+
+
+def bench_run_simulation(profile: Profile, n_candidates: int, n_voters: int):
+    streams = {'log': io.StringIO(), 'out': open(os.devnull, 'w')}
+    # resetting the profile (O(n_voters)) is timed too
+    return lambda: run_simulation(profile.all_candidates, profile.all_voters, profile.reset(),
+                                  profile.tie_breaking_rule, Random(0), **SUMMARY, **streams)
+
+
+def bench_run_all_simulations_per_seed(profile: Profile, n_candidates: int, n_voters: int):
+    args = {'--cmin': str(n_candidates), '--cmax': str(n_candidates), '--vmin': str(n_voters),
+            '--vmax': str(n_voters), '--random-search': True, '--utility': 'borda', '--preference': 'single-peaked',
+            '--tiebreakingrule': 'lexicographic', '--voters': 'general', '<BASE>': None, '<EXPO_STEP>': None,
+            'assigned_seed': 0, 'log': io.StringIO(), 'out': open(os.devnull, 'w')}
+    return lambda: run_all_simulations_per_seed(args)
+
+
+BENCHMARKS = {
+    'in_order': bench_in_order,
+    'propose_enhancement': bench_propose_enhancement,
+    'total_utility': bench_total_utility,
+    'is_condorcet_winner': bench_is_condorcet_winner,
+    'condorcet_winners': bench_condorcet_winners,
+    'permute_identityless': bench_permute_identityless,
+    'run_simulation': bench_run_simulation,
+    'run_all_simulations_per_seed': bench_run_all_simulations_per_seed,
+}
+
+
+def run_benchmarks(names: list, candidates_grid: list, voters_grid: list, repeat: int = 5, log=sys.stdout) -> dict:
+    """Time every benchmark on every cell of the grid
+
+    :param names: keys of BENCHMARKS
+    :param repeat: number of timings of every benchmark. The best one is kept.
+    :return: {'<name> c=<n_candidates> v=<n_voters>': best seconds per call}
+    """
+    results = dict()
+    for name in names:
+        for n_candidates in candidates_grid:
+            for n_voters in voters_grid:
+                if n_voters < n_candidates:
+                    continue
+                key = f'{name} c={n_candidates} v={n_voters}'
+                run = BENCHMARKS[name](Profile(n_candidates, n_voters), n_candidates, n_voters)
+                if run is None:
+                    log.write(f'{key:<50} skipped\n')
+                    continue
+                timer = timeit.Timer(run)
+                number, _ = timer.autorange()
+                results[key] = min(timer.repeat(repeat, number)) / number
+                log.write(f'{key:<50} {results[key]:.6g} s\n')
+                log.flush()
+    return results
+
+
+def environment() -> dict:
+    return {'date': datetime.now().isoformat(timespec='seconds'), 'commit': commit(),
+            'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(), 'processor': platform.processor(),
+            'node': platform.node()}
+
+
+def commit():
+    """The git commit of the benchmarked code, if it is a checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(baselines: dict, label: str, results: dict, tolerance: float, log=sys.stdout) -> int:
+    """Compare results to a baseline, benchmark by benchmark. The other stored baselines are shown along.
+
+    :param baselines: {label: {'environment': ..., 'results': ...}}
+    :param label: the baseline to compare with
+    :param tolerance: relative slow down (or speed up) before a benchmark is flagged
+    :return: the number of regressions
+    """
+    baseline = baselines[label]
+    labels = [other for other in baselines if other != label] + [label]
+    regressions = 0
+    log.write(f'\n{"benchmark":<50} {"".join(f"{other:>12} " for other in labels)}{"now":>12} {"ratio":>7}\n')
+    for key, current in results.items():
+        stored = ''.join(f'{baselines[other]["results"][key]:>12.6g} ' if key in baselines[other]['results']
+                         else f'{"-":>12} ' for other in labels)
+        if key not in baseline['results']:
+            log.write(f'{key:<50} {stored}{current:>12.6g}\n')
+            continue
+        ratio = current / baseline['results'][key]
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = 'REGRESSION'
+            regressions += 1
+        elif ratio < 1 - tolerance:
+            flag = 'improved'
+        log.write(f'{key:<50} {stored}{current:>12.6g} {ratio:>7.2f} {flag}\n')
+    for other in labels:
+        environment = baselines[other]['environment']
+        log.write(f'\n{other}: commit {environment.get("commit")}, {environment["date"]} ({environment["node"]})')
+    log.write(f'\n{regressions} regression(s) beyond {tolerance:.0%}, against the {label} baseline\n')
+    if baseline['environment']['node'] != platform.node():
+        log.write('Warning: the baseline was measured on another machine\n')
+    return regressions
+
+
+def main():
+    doc = """Benchmarks of the simulation core
+
+Usage:
+  bench.py [options] [<BENCHMARK>...]
+
+
+Options:
+  --candidates=LIST     Numbers of candidates, comma separated              [Default: 3,5,7]
+  --voters=LIST         Numbers of voters, comma separated                  [Default: 8,12,24]
+  -n, --repeat=REPEAT   Timings of every benchmark, the best one is kept    [Default: 5]
+  -b, --baseline=BFILE  Stored baselines to compare with                    [Default: bench_baseline.json]
+  --label=LABEL         Baseline to compare with, or to save the results as 
+                        (e.g. before: the commit before an engine change)   [Default: current]
+  --save                Store the results as the baseline of the label, 
+                        instead of comparing with it
+  --tolerance=TOLERANCE Relative slow down reported as a regression         [Default: 0.20]
+  -l, --list            List the benchmarks and exit
+  -h, --help            Print the help screen
+  BENCHMARK             Benchmarks to run (all if omitted)
+
+
+"""
+
+    args = docopt(doc)
+    if args['--list']:
+        print('\n'.join(BENCHMARKS))
+        return 0
+    names = args['<BENCHMARK>'] or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise TypeError(f'Unknown benchmark(s) {unknown}, see --list.')
+    candidates_grid = [int(n) for n in args['--candidates'].split(',')]
+    voters_grid = [int(n) for n in args['--voters'].split(',')]
+
+    results = run_benchmarks(names, candidates_grid, voters_grid, int(args['--repeat']))
+
+    baseline_path = args['--baseline']
+    label = args['--label']
+    baselines = dict()
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as baseline_file:
+            baselines = json.load(baseline_file)
+    if args['--save']:
+        # keep the benchmarks that were not run this time
+        old_results = baselines.get(label, dict()).get('results', dict())
+        baselines[label] = {'environment': environment(), 'results': {**old_results, **results}}
+        with open(baseline_path, 'w') as baseline_file:
+            json.dump(baselines, baseline_file, indent=2)
+        print(f'Baseline {label} saved to {baseline_path}')
+        return 0
+    if label not in baselines:
+        print(f'No baseline {label} in {baseline_path} to compare with, see --save.')
+        return 0
+    return 1 if report(baselines, label, results, float(args['--tolerance'])) else 0
+
+
+# --------------------------
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,14 @@
+import bisect
+import heapq
 import itertools
 import math
 from random import Random
-import matplotlib.pyplot as plt
 import numpy as np
 import sys
 import os
-from mpi4py import MPI
+import pickle
+import struct
+import time
 
 from docopt import docopt
 from ntu.votes.candidate import *
@@ -14,26 +17,142 @@ from ntu.votes.tiebreaking import *
 from ntu.votes.utility import *
 from ntu.votes.voter import *
 from helper import *
+from exact import run_simulation_exact
+from lockstep import run_simulation_lockstep
+from timers import PhaseTimers, summarize
+
+
+# Numeric attributes of Measurements, as fields of the rows of pack_measurements()
+PACKED_ATTRIBUTES = (('n_voters', np.uint16), ('n_candidates', np.uint16), ('percentage_of_convergence', np.float64),
+                     ('average_time_to_convergence', np.float64), ('average_social_welfare', np.float64),
+                     ('percentage_truthful_winner_wins', np.float64),
+                     ('percentage_winner_is_weak_condorcet', np.float64),
+                     ('percentage_winner_is_strong_condorcet', np.float64), ('percentage_of_cycles', np.float64),
+                     ('average_cycle_length', np.float64), ('average_cycle_entry_step', np.float64),
+                     ('n_alleles', np.uint16))
+PACKED_SETS = ('stable_states_sets', 'winning_sets')
+PACKED_ROW = np.dtype([('seed', np.int64), *PACKED_ATTRIBUTES, *((set_name, np.uint16) for set_name in PACKED_SETS),
+                       ('members', np.uint64), ('integer_positions', np.bool_)])
+# members (and the codes of the sets) are bit masks of the candidates, by index
+MAX_CANDIDATES = PACKED_ROW['members'].itemsize * 8
 
 
 class Measurements:
     """Holds the complete set of measures of (50?) alleles: same voters, same candidates, same profile, different
-    random scenarios."""
+    random scenarios.
+
+    Winner sets are kept as bitmasks of candidate indices (stable_states_codes, winning_codes) over a table of the
+    candidates (indexed by Candidate.index). stable_states_sets and winning_sets build the sets of candidates from
+    them on demand. to_bytes() and from_bytes() give a compact fixed-layout binary form, also used for pickling.
+    """
+    __slots__ = ('n_voters', 'n_candidates', 'percentage_of_convergence', 'average_time_to_convergence',
+                 'average_social_welfare', 'percentage_truthful_winner_wins', 'percentage_winner_is_weak_condorcet',
+                 'percentage_winner_is_strong_condorcet', 'percentage_of_cycles', 'average_cycle_length',
+                 'average_cycle_entry_step', 'n_alleles', 'candidates', 'stable_states_codes', 'winning_codes')
     n_voters: int
     n_candidates: int
     percentage_of_convergence: float
     average_time_to_convergence: float
     average_social_welfare: float
     # How many different stable states we have across all iteration sequences of the same preference profile
-    stable_states_sets: set
-    winning_sets: set
+    stable_states_codes: tuple  # sorted, distinct
+    winning_codes: tuple
+    candidates: list  # candidates[candidate.index], None if not in any set
     percentage_truthful_winner_wins: float
     percentage_winner_is_weak_condorcet: float
     percentage_winner_is_strong_condorcet: float
+    # Only measured with cycle detection (see run_simulation())
+    percentage_of_cycles: float
+    average_cycle_length: float
+    average_cycle_entry_step: float
+    # Number of alleles run (see --adaptive-alleles), 0 for the exact outcomes of exact.py
+    n_alleles: int
+
+    # the numeric attributes, number of codes of both sets, members, integer positions
+    HEADER = struct.Struct('<' + ''.join(np.dtype(dtype).char for _, dtype in PACKED_ATTRIBUTES) + 'HHQ?')
 
     def __init__(self):
-        self.stable_states_sets = set()
-        self.winning_sets = set()
+        self.candidates = []
+        self.stable_states_codes = self.winning_codes = ()
+        self.percentage_of_cycles = self.average_cycle_length = self.average_cycle_entry_step = 0
+        self.n_alleles = 0
+
+    @staticmethod
+    def code(winner_s) -> int:
+        """Bitmask of the indices of a set of candidates"""
+        return sum(1 << candidate.index for candidate in winner_s)
+
+    def __decode(self, codes: tuple) -> set:
+        return {frozenset(candidate for candidate in self.candidates if candidate is not None
+                          and code >> candidate.index & 1) for code in codes}
+
+    def __encode(self, winner_sets) -> tuple:
+        for winner_s in winner_sets:
+            for candidate in winner_s:
+                if candidate.index >= len(self.candidates):
+                    self.candidates.extend([None] * (candidate.index + 1 - len(self.candidates)))
+                self.candidates[candidate.index] = candidate
+        return tuple(sorted({Measurements.code(winner_s) for winner_s in winner_sets}))
+
+    @property
+    def stable_states_sets(self) -> set:
+        return self.__decode(self.stable_states_codes)
+
+    @stable_states_sets.setter
+    def stable_states_sets(self, winner_sets) -> None:
+        self.stable_states_codes = self.__encode(winner_sets)
+
+    @property
+    def winning_sets(self) -> set:
+        return self.__decode(self.winning_codes)
+
+    @winning_sets.setter
+    def winning_sets(self, winner_sets) -> None:
+        self.winning_codes = self.__encode(winner_sets)
+
+    def members(self) -> int:
+        """Bitmask of the candidates found in any set"""
+        members = 0
+        for code in self.stable_states_codes:
+            members |= code
+        for code in self.winning_codes:
+            members |= code
+        return members
+
+    def to_bytes(self) -> bytes:
+        """Fixed-layout binary form: HEADER, then the positions of the members (by index), then the codes"""
+        members = self.members()
+        positions = [self.candidates[index].position for index in range(members.bit_length()) if members >> index & 1]
+        header = Measurements.HEADER.pack(*(getattr(self, attr) for attr, _ in PACKED_ATTRIBUTES),
+                                          len(self.stable_states_codes), len(self.winning_codes), members,
+                                          all(isinstance(position, int) for position in positions))
+        codes = [*self.stable_states_codes, *self.winning_codes]
+        return header + struct.pack(f'<{len(positions)}d{len(codes)}Q', *positions, *codes)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Measurements':
+        """Decode the output of to_bytes()"""
+        fields = Measurements.HEADER.unpack_from(data)
+        new = cls()
+        for (attr, _), value in zip(PACKED_ATTRIBUTES, fields):
+            setattr(new, attr, value)
+        n_stable_states, n_winning, members, integer_positions = fields[len(PACKED_ATTRIBUTES):]
+        indices = [index for index in range(members.bit_length()) if members >> index & 1]
+        values = struct.unpack_from(f'<{len(indices)}d{n_stable_states + n_winning}Q', data, Measurements.HEADER.size)
+        new.set_members(indices, values[:len(indices)], integer_positions)
+        new.stable_states_codes = values[len(indices):len(indices) + n_stable_states]
+        new.winning_codes = values[len(indices) + n_stable_states:]
+        return new
+
+    def set_members(self, indices: list, positions: list, integer_positions: bool) -> None:
+        """Rebuild the candidates table from the indices and positions of the members (names are by index)"""
+        self.candidates = [None] * (indices[-1] + 1 if indices else 0)
+        position_type = int if integer_positions else float
+        for index, position in zip(indices, positions):
+            self.candidates[index] = Candidate(chr(b'A'[0] + index), position_type(position), index)
+
+    def __reduce__(self):
+        return Measurements.from_bytes, (self.to_bytes(),)
 
     def __str__(self):
         sss = self.stable_states_sets
@@ -47,79 +166,425 @@ class Measurements:
             f"winning_sets: count = {len(ws)}, repr = {[set(s) for s in ws]}\n" \
             f"percentage_truthful_winner_wins = {self.percentage_truthful_winner_wins}%\n" \
             f"percentage_winner_is_weak_condorcet = {self.percentage_winner_is_weak_condorcet}%\n" \
-            f"percentage_winner_is_strong_condorcet = {self.percentage_winner_is_strong_condorcet}%"
+            f"percentage_winner_is_strong_condorcet = {self.percentage_winner_is_strong_condorcet}%\n" \
+            f"percentage_of_cycles = {self.percentage_of_cycles}%\n" \
+            f"average_cycle_length = {self.average_cycle_length}\n" \
+            f"average_cycle_entry_step = {self.average_cycle_entry_step}\n" \
+            f"n_alleles = {self.n_alleles}"
+
+
+def pack_measurements(results: dict) -> dict:
+    """Encode {seed: [measurements, ...]} into three flat numpy arrays, to be sent between MPI ranks.
+
+    'rows' holds one record per measurements: the seed, the numeric attributes, the number of sets of every set
+    attribute and 'members', the bitmask of the (indices of the) candidates appearing in any of these sets.
+    'codes' holds every winner set as a bitmask of the indices of its candidates, row after row, and 'positions' the
+    positions of the members of every row, by index.
+    :param results: {seed: [measurements, ...]}
+    :return: {'rows': ..., 'codes': ..., 'positions': ...}
+    """
+    all_measurements = [(seed, msrmnt) for seed, msrmnt_lst in results.items() for msrmnt in msrmnt_lst]
+    max_candidates = max((msrmnt.n_candidates for _, msrmnt in all_measurements), default=1)
+    rows = np.zeros(len(all_measurements), dtype=PACKED_ROW)
+    codes, positions = [], []
+    for row, (seed, msrmnt) in enumerate(all_measurements):
+        rows[row]['seed'] = seed
+        for attr, _ in PACKED_ATTRIBUTES:
+            rows[row][attr] = getattr(msrmnt, attr)
+        rows[row]['stable_states_sets'] = len(msrmnt.stable_states_codes)
+        rows[row]['winning_sets'] = len(msrmnt.winning_codes)
+        codes.extend(msrmnt.stable_states_codes)
+        codes.extend(msrmnt.winning_codes)
+        members = msrmnt.members()
+        row_positions = [msrmnt.candidates[index].position
+                         for index in range(members.bit_length()) if members >> index & 1]
+        rows[row]['members'] = members
+        rows[row]['integer_positions'] = all(isinstance(position, int) for position in row_positions)
+        positions.extend(row_positions)
+    return {'rows': rows, 'codes': np.array(codes, dtype=np.min_scalar_type((1 << max_candidates) - 1)),
+            'positions': np.array(positions, dtype=np.float64)}
+
+
+def unpack_measurements(packed: dict) -> dict:
+    """Decode the output of pack_measurements()
+
+    :param packed: {'rows': ..., 'codes': ..., 'positions': ...}
+    :return: {seed: [measurements, ...]}, in the order they were packed
+    """
+    results = dict()
+    codes = iter(packed['codes'].tolist())
+    positions = iter(packed['positions'].tolist())
+    for row in packed['rows'].tolist():
+        fields = dict(zip(PACKED_ROW.names, row))
+        measurements = Measurements()
+        for attr, _ in PACKED_ATTRIBUTES:
+            setattr(measurements, attr, fields[attr])
+        members = fields['members']
+        indices = [index for index in range(members.bit_length()) if members >> index & 1]
+        measurements.set_members(indices, list(itertools.islice(positions, len(indices))), fields['integer_positions'])
+        measurements.stable_states_codes = tuple(itertools.islice(codes, fields['stable_states_sets']))
+        measurements.winning_codes = tuple(itertools.islice(codes, fields['winning_sets']))
+        results.setdefault(fields['seed'], []).append(measurements)
+    return results
+
+
+class MeasurementStore:
+    """Columnar store of all the measurements of a run, appended to as packed results arrive (see pack_measurements).
+
+    Each measurements is one row of a structured numpy array (seed, n_voters, n_candidates, every numeric attribute
+    and the number of sets of every set attribute), instead of a Measurements object. Rows are kept in arrival order,
+    and every (n_candidates, n_voters) cell keeps the indices of its rows, so grouping by either axis is a lookup.
+    The winner sets themselves are kept packed, for checkpoints and unpack_measurements().
+    """
+
+    def __init__(self):
+        self.rows = np.zeros(0, dtype=PACKED_ROW)
+        self.n_rows = 0
+        self.cells = dict()  # (n_candidates, n_voters) -> [indices of its rows, number of them]
+        self.seeds = dict()  # seed -> None, in arrival order
+        self.codes = []  # packed 'codes' and 'positions' chunks
+        self.positions = []
+
+    def append(self, packed: dict) -> None:
+        """Add the results of new seeds, as packed by pack_measurements()"""
+        new_rows = packed['rows']
+        self.rows = MeasurementStore.__fit(self.rows, self.n_rows, len(new_rows))
+        self.rows[self.n_rows:self.n_rows + len(new_rows)] = new_rows
+        for row, (seed, n_candidates, n_voters) in enumerate(zip(new_rows['seed'].tolist(),
+                                                                  new_rows['n_candidates'].tolist(),
+                                                                  new_rows['n_voters'].tolist()), self.n_rows):
+            self.seeds[seed] = None
+            cell = self.cells.setdefault((n_candidates, n_voters), [np.zeros(0, dtype=np.int64), 0])
+            cell[0] = MeasurementStore.__fit(cell[0], cell[1], 1)
+            cell[0][cell[1]] = row
+            cell[1] += 1
+        self.n_rows += len(new_rows)
+        self.codes.append(packed['codes'])
+        self.positions.append(packed['positions'])
+
+    @staticmethod
+    def __fit(array: np.ndarray, length: int, extra: int) -> np.ndarray:
+        """The array itself, or a copy twice as large if it can not hold 'extra' more items"""
+        if length + extra <= len(array):
+            return array
+        grown = np.zeros(max(16, 2 * (length + extra)), dtype=array.dtype)
+        grown[:length] = array[:length]
+        return grown
+
+    def __len__(self):
+        """Number of seeds"""
+        return len(self.seeds)
+
+    def column(self, cell: tuple, attr_name: str, start: int = 0, stop: int = None) -> np.ndarray:
+        """Values of one attribute in one (n_candidates, n_voters) cell, in arrival order. For set attributes, the
+        number of sets.
+
+        :param start: first row of the cell to return
+        :param stop: row of the cell to stop before, all the rows if None
+        """
+        indices, length = self.cells[cell]
+        return self.rows[attr_name][indices[start:length if stop is None else min(stop, length)]]
+
+    def by_candidates(self) -> dict:
+        """{n_candidates: {n_voters: cell}}, both sorted"""
+        grouped = dict()
+        for n_candidates, n_voters in sorted(self.cells):
+            grouped.setdefault(n_candidates, dict())[n_voters] = (n_candidates, n_voters)
+        return grouped
+
+    def by_voters(self) -> dict:
+        """{n_voters: {n_candidates: cell}}, both sorted"""
+        grouped = dict()
+        for n_candidates, n_voters in sorted(self.cells, key=lambda cell: (cell[1], cell[0])):
+            grouped.setdefault(n_voters, dict())[n_candidates] = (n_candidates, n_voters)
+        return grouped
+
+    def packed(self) -> dict:
+        """Everything stored, in the format of pack_measurements()"""
+        return {'rows': self.rows[:self.n_rows].copy(),
+                'codes': np.concatenate(self.codes) if self.codes else np.zeros(0, dtype=np.uint8),
+                'positions': np.concatenate(self.positions) if self.positions else np.zeros(0)}
 
 
 def aggregate_alleles(alleles: list, all_voters: list, profile: list, utility: Utility,
-                      tiebreakingrule: TieBreakingRule) -> Measurements:
-    measurements = Measurements()
-    measurements.n_voters = len(profile)  # len(all_voters) is also OK
-    measurements.n_candidates = len(profile[0])
-    convergence_counter = welfare = truthful_winner_wins_counter = winner_is_weak_condorcet_counter = \
-        winner_is_strong_condorcet_counter = 0.0
-    steps_before_convergence = []
-    for allele in alleles:
-        initial_state: Status = allele[0]
-        converged: bool = allele[-1]
-        final_status = allele[-2]
-        # lastAction: UpdateEvent = allele[-3] # not needed
-        final_status_toppers = final_status.toppers
+                      tiebreakingrule: TieBreakingRule, condorcet: tuple = None,
+                      alleles_cycles: list = None) -> Measurements:
+    """
+    :param alleles_cycles: the (entry step, length) of the cycle of every allele, None for alleles without one
+    """
+    accumulator = AllelesAccumulator(all_voters, profile, utility, tiebreakingrule, condorcet)
+    for allele, cycle in zip(alleles, alleles_cycles or [None] * len(alleles)):
+        accumulator.add_scenario(allele, cycle)
+    return accumulator.measurements()
+
 
+def aggregate_outcomes(outcomes: list, all_voters: list, profile: list, utility: Utility,
+                       tiebreakingrule: TieBreakingRule, condorcet: tuple = None) -> Measurements:
+    """Same as aggregate_alleles(), but for alleles already reduced to what the measures need.
+
+    :param outcomes: one (initial toppers, final toppers, converged, steps) tuple per allele
+    :param condorcet: the (weak, strong) Condorcet winners of the profile, see condorcet_winners(). Calculated here if
+        not given.
+    """
+    accumulator = AllelesAccumulator(all_voters, profile, utility, tiebreakingrule, condorcet)
+    for outcome in outcomes:
+        accumulator.add(*outcome)
+    return accumulator.measurements()
+
+
+class AllelesAccumulator:
+    """Online version of aggregate_alleles(): alleles are added one by one, as soon as each one finishes, and only the
+    running counters are kept."""
+
+    def __init__(self, all_voters: list, profile: list, utility: Utility, tiebreakingrule: TieBreakingRule,
+                 condorcet: tuple = None):
+        """
+        :param condorcet: the (weak, strong) Condorcet winners of the profile, see condorcet_winners(). Calculated
+            here if not given.
+        """
+        if condorcet is None:
+            condorcet = condorcet_winners(profile)
+        self.weak_condorcet_winners, self.strong_condorcet_winners = condorcet
+        self.all_voters = all_voters
+        self.utility = utility
+        self.tiebreakingrule = tiebreakingrule
+        self.n_voters = len(profile)  # len(all_voters) is also OK
+        self.n_candidates = len(profile[0])
+        self.n_alleles = 0
+        self.convergence_counter = self.welfare = self.truthful_winner_wins_counter = \
+            self.winner_is_weak_condorcet_counter = self.winner_is_strong_condorcet_counter = 0.0
+        self.steps_before_convergence = 0.0  # sum of
+        self.cycle_counter = self.cycle_lengths = self.cycle_entry_steps = 0.0
+        self.stable_states_sets = set()
+        self.winning_sets = set()
+
+    def add_scenario(self, scenario, cycle: tuple = None) -> None:
+        """Add an allele given as returned by run_simulation(): a full scenario list or a ScenarioSummary
+
+        :param cycle: (entry step, length) of the cycle the allele stopped at, if any
+        """
+        initial_state: Status = scenario[0]
+        converged: bool = scenario[-1]
+        final_status = scenario[-2]
+        # lastAction: UpdateEvent = scenario[-3] # not needed
+        # initial state, final boolean, 2 entries each step
+        steps = (len(scenario) - 1 - 1) / 2
+        self.add(initial_state.toppers, final_status.toppers, converged, steps, cycle)
+
+    def add(self, initial_toppers: list, final_status_toppers: list, converged: bool, steps: float,
+            cycle: tuple = None, weight: float = 1.0) -> None:
+        """
+        :param weight: how many alleles this one counts for. The exact engine adds every outcome with its probability.
+        """
+        tiebreakingrule = self.tiebreakingrule
         if isinstance(tiebreakingrule, RandomTieBreakingRule):
-            initial_winner_s = frozenset(initial_state.toppers)
+            initial_winner_s = frozenset(initial_toppers)
             final_winner_s = frozenset(final_status_toppers)
-        elif isinstance(tiebreakingrule, LexicographicTieBreakingRule):
-            initial_winner_s = frozenset([tiebreakingrule.get_winner(initial_state.toppers)])
+        elif isinstance(tiebreakingrule, FixedPriorityTieBreakingRule):
+            initial_winner_s = frozenset([tiebreakingrule.get_winner(initial_toppers)])
             final_winner_s = frozenset([tiebreakingrule.get_winner(final_status_toppers)])
         else:
             raise TypeError("Tie breaking rule not known")
 
-        measurements.winning_sets.add(final_winner_s)
+        self.n_alleles += weight
+        self.winning_sets.add(final_winner_s)
 
         if initial_winner_s == final_winner_s:
-            truthful_winner_wins_counter += 1
+            self.truthful_winner_wins_counter += weight
 
         if converged:
-            convergence_counter += 1
-            # initial state, final boolean, 2 entries each step
-            steps_before_convergence.append((len(allele) - 1 - 1) / 2)
+            self.convergence_counter += weight
+            self.steps_before_convergence += steps * weight
             # A stable states is simply the state of a converged system.
-            measurements.stable_states_sets.add(final_winner_s)
+            self.stable_states_sets.add(final_winner_s)
 
-        for voter in all_voters:
-            welfare += utility.total_utility(voter.profile, final_status_toppers, tiebreakingrule)
+        for voter in self.all_voters:
+            self.welfare += self.utility.total_utility(voter.profile, final_status_toppers, tiebreakingrule,
+                                                       voter.ranks) * weight
 
-        # if not is_condorcet _winner(profile, final_status.toppers[0]):
-        #     others = profile[0].copy()
-        #     others.remove(final_status.toppers[0])
-        #     for other in others:
-        #         if is_condorcet_winner(profile, other):
-        #             print("found", other, repr(profile))
+        if cycle is not None:
+            self.cycle_counter += weight
+            self.cycle_entry_steps += cycle[0] * weight
+            self.cycle_lengths += cycle[1] * weight
 
-        for winner in final_winner_s:
-            if not is_condorcet_winner(profile, winner, week=True):
-                break
-        else:  # else of the (for loop), not of the (if statement)
-            winner_is_weak_condorcet_counter += 1
+        if final_winner_s <= self.weak_condorcet_winners:
+            self.winner_is_weak_condorcet_counter += weight
             # test again for strong condorcet winner
-            for winner in final_winner_s:
-                if not is_condorcet_winner(profile, winner, week=False):
-                    break
-            else:
-                winner_is_strong_condorcet_counter += 1
-
-    len_steps_before_convergence = len(steps_before_convergence)
-    len_alleles = len(alleles)
-    measurements.percentage_of_convergence = convergence_counter * 100.0 / len_steps_before_convergence \
-        if len_steps_before_convergence else 100
-    measurements.average_time_to_convergence = sum(steps_before_convergence) / len_steps_before_convergence \
-        if len_steps_before_convergence else 0
-    measurements.average_social_welfare = welfare / len_alleles  # TODO Discuss
-    measurements.percentage_truthful_winner_wins = truthful_winner_wins_counter * 100 / len_alleles
-    measurements.percentage_winner_is_weak_condorcet = winner_is_weak_condorcet_counter * 100 / len_alleles
-    measurements.percentage_winner_is_strong_condorcet = winner_is_strong_condorcet_counter * 100 / len_alleles
+            if final_winner_s <= self.strong_condorcet_winners:
+                self.winner_is_strong_condorcet_counter += weight
+
+    def measurements(self) -> Measurements:
+        """The measurements of all the alleles added so far"""
+        measurements = Measurements()
+        measurements.n_voters = self.n_voters
+        measurements.n_candidates = self.n_candidates
+        measurements.n_alleles = round(self.n_alleles)
+        measurements.stable_states_sets = set(self.stable_states_sets)
+        measurements.winning_sets = set(self.winning_sets)
+        # The number of converged alleles is the number of entries in the steps_before_convergence list
+        len_steps_before_convergence = self.convergence_counter
+        len_alleles = self.n_alleles
+        measurements.percentage_of_convergence = self.convergence_counter * 100.0 / len_steps_before_convergence \
+            if len_steps_before_convergence else 100
+        measurements.average_time_to_convergence = self.steps_before_convergence / len_steps_before_convergence \
+            if len_steps_before_convergence else 0
+        measurements.average_social_welfare = self.welfare / len_alleles  # TODO Discuss
+        measurements.percentage_truthful_winner_wins = self.truthful_winner_wins_counter * 100 / len_alleles
+        measurements.percentage_winner_is_weak_condorcet = self.winner_is_weak_condorcet_counter * 100 / len_alleles
+        measurements.percentage_winner_is_strong_condorcet = \
+            self.winner_is_strong_condorcet_counter * 100 / len_alleles
+        if self.cycle_counter:
+            measurements.percentage_of_cycles = self.cycle_counter * 100 / len_alleles
+            measurements.average_cycle_length = self.cycle_lengths / self.cycle_counter
+            measurements.average_cycle_entry_step = self.cycle_entry_steps / self.cycle_counter
+        return measurements
+
+    def estimates(self) -> tuple:
+        """The per allele estimates of the measures so far, see --adaptive-alleles: the convergence rate, the average
+        steps to convergence, the average social welfare, and the rates of truthful, weak and strong Condorcet
+        winners"""
+        n_alleles = self.n_alleles
+        return (self.convergence_counter / n_alleles,
+                self.steps_before_convergence / self.convergence_counter if self.convergence_counter else 0,
+                self.welfare / n_alleles, self.truthful_winner_wins_counter / n_alleles,
+                self.winner_is_weak_condorcet_counter / n_alleles, self.winner_is_strong_condorcet_counter / n_alleles)
+
+
+def estimates_stable(previous: tuple, current: tuple, tolerance: float) -> bool:
+    """Whether every estimate moved by at most tolerance (relative to the previous one, if more than 1)"""
+    return all(abs(new - old) <= tolerance * max(1, abs(old)) for old, new in zip(previous, current))
+
+
+class ScenarioSummary:
+    """Stands in for the scenario list of run_simulation() when the trajectory is not kept.
+
+    It remembers only what AllelesAccumulator.add_scenario() reads: the first and the last two entries, and the length.
+    """
 
-    return measurements
+    def __init__(self):
+        self.length = 0
+        self.first = self.before_last = self.last = None
+
+    def append(self, entry) -> None:
+        if not self.length:
+            self.first = entry
+        self.before_last, self.last = self.last, entry
+        self.length += 1
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        try:
+            return {0: self.first, -1: self.last, -2: self.before_last}[index]
+        except KeyError:
+            raise IndexError(f'Only the first and the last two entries are kept, not {index}')
+
+
+class ActiveVoters:
+    """The voters run_simulation() may ask to vote, updated incrementally instead of being filtered from scratch.
+
+    A voter is active unless it abstains (for good) or votes for a candidate that wins with a probability of at least
+    1 / len(toppers). Active voters are kept in a sorted list, so random choices pick the same voters a fresh filtered
+    list would. After each status change, refresh() only re-examines the voters whose state could have changed: the
+    ones whose vote moved, the ones that failed to improve, and the ones voting for a candidate whose satisfaction
+    changed.
+    """
+
+    def __init__(self, all_voters: list):
+        self.all_voters = all_voters
+        self.abstaining = bytearray(len(all_voters))  # only increase
+        self.is_active = bytearray(len(all_voters))
+        self.indices = []  # sorted
+        self.by_vote = dict()  # candidate -> indices of the voters voting for it
+        for i, voter in enumerate(all_voters):
+            self.by_vote.setdefault(voter.most_recent_vote, set()).add(i)
+        self.satisfied = None
+        self.touched = set()  # voters to re-examine on the next refresh()
+
+    def refresh(self, satisfied: set) -> list:
+        """Update the active voters for the candidates now satisfying their voters, and return them (sorted)"""
+        if self.satisfied is None:
+            touched = range(len(self.all_voters))
+        else:
+            touched = self.touched
+            for candidate in self.satisfied.symmetric_difference(satisfied):
+                touched.update(self.by_vote.get(candidate, ()))
+        self.satisfied = satisfied
+        for i in touched:
+            if not self.abstaining[i] and self.all_voters[i].most_recent_vote not in satisfied:
+                self.add(i)
+            else:
+                self.remove(i)
+        self.touched = set()
+        return self.indices
+
+    def add(self, i: int) -> None:
+        if not self.is_active[i]:
+            self.is_active[i] = 1
+            bisect.insort(self.indices, i)
+
+    def remove(self, i: int) -> None:
+        if self.is_active[i]:
+            self.is_active[i] = 0
+            del self.indices[bisect.bisect_left(self.indices, i)]
+
+    def fail(self, i: int, abstain=False) -> None:
+        """The voter could not improve: inactive till the next status change, or for good if it abstains"""
+        self.remove(i)
+        if abstain:
+            self.abstaining[i] = 1
+        self.touched.add(i)
+
+    def voted(self, i: int, previous_vote: Candidate) -> None:
+        """The voter was asked and its status changed. Its vote may have changed from previous_vote."""
+        vote = self.all_voters[i].most_recent_vote
+        if vote != previous_vote:
+            self.by_vote[previous_vote].discard(i)
+            self.by_vote.setdefault(vote, set()).add(i)
+        self.touched.add(i)
+
+    def abstaining_indices(self) -> tuple:
+        return tuple(i for i, abstaining in enumerate(self.abstaining) if abstaining)
+
+
+def pairwise_majority(profile: list, ranks: list = None) -> np.ndarray:
+    """Count, for every pair of candidates, how many voters prefer the first to the second.
+
+    :param profile: the collective profile (one ordered list of candidates per voter)
+    :param ranks: (compact mode) the voters rank arrays, in the same order as profile. If not given, they are
+        rebuilt from the profile.
+    :return: matrix m where m[i, j] is the number of voters ranking candidate of index i above candidate of index j
+    """
+    if ranks is not None:
+        ranks = np.array(ranks)  # ranks[v, c] index of candidate c in profile of v
+    else:
+        n_candidates = len(profile[0])
+        ranks = np.empty((len(profile), n_candidates), dtype=int)
+        for voter_index, voter_profile in enumerate(profile):
+            ranks[voter_index, [candidate.index for candidate in voter_profile]] = np.arange(n_candidates)
+    return np.sum(ranks[:, :, np.newaxis] < ranks[:, np.newaxis, :], axis=0)
+
+
+def condorcet_winners(profile: list, majority: np.ndarray = None, ranks: list = None) -> tuple:
+    """Find the weak and strong Condorcet winners of a profile in one pass over its pairwise majority matrix.
+
+    A weak Condorcet winner is beaten by no other candidate head to head, a strong one beats every other candidate.
+    :param profile: the collective profile
+    :param majority: the pairwise_majority() of the profile, if already calculated
+    :param ranks: (compact mode) the voters rank arrays, to build the matrix from, see pairwise_majority()
+    :return: (frozenset of weak Condorcet winners, frozenset of strong Condorcet winners). The strong winner, if any,
+        is the only weak winner as well.
+    """
+    if majority is None:
+        majority = pairwise_majority(profile, ranks)
+    candidates = sorted(profile[0], key=lambda candidate: candidate.index)
+    not_beaten = np.all(majority >= majority.T, axis=1)
+    # ignore the diagonal, where a candidate is always tied with itself
+    beats_all = np.all((majority > majority.T) | np.eye(len(candidates), dtype=bool), axis=1)
+    weak = frozenset(candidate for candidate, flag in zip(candidates, not_beaten) if flag)
+    strong = frozenset(candidate for candidate, flag in zip(candidates, beats_all) if flag)
+    return weak, strong
 
 
 def is_condorcet_winner(profile: list, query: Candidate, week=True) -> bool:
@@ -173,8 +638,47 @@ Options:
                                 (lexicographic | random)                        [Default: lexicographic]
   -i, --initial-run-size=SIZE   Initial number of runs before testing for 
                                 convergence                                     [Default: 100]
+  --schedule=SCHEDULE   How seeds are divided among MPI ranks 
+                        (static | dynamic | cells). static: equal contiguous 
+                        chunks, dynamic: rank 0 hands out seeds one at a time 
+                        as workers finish them, cells: (seed, cell) units, the 
+                        costliest first, to the least loaded rank. cells draws 
+                        every cell from its own random stream, so its results 
+                        differ from the other two                               [Default: static]
   --voters=VOTERS       Type of voters (general | truthful | lazy)              [Default: general]
+  --compact             Index candidates by integer ids and keep voters rank arrays
+  --engine=ENGINE       How to run the alleles of a profile 
+                        (sequential | lockstep | exact). exact: the exact 
+                        probabilities of all outcomes, instead of alleles       [Default: sequential]
+  --exact-max-states=N  Profiles with more reachable states fall back to the 
+                        sequential engine (exact engine)                        [Default: 20000]
+  --memo-size=SIZE      Keep up to SIZE best responses of voters per seed, to 
+                        reuse them in recurring situations (0: no memo)         [Default: 0]
+  --detect-cycles       Stop a scenario (as not converged) once it revisits a 
+                        state, and measure these cycles (sequential engine)
+  --max-alleles=N       Number of alleles (scenarios) per profile, or the most 
+                        of them with --adaptive-alleles                         [Default: 50]
+  --adaptive-alleles    Run the alleles of a profile in batches, and stop once 
+                        the estimates of the measures are stable (sequential 
+                        or exact engine, without --keep-scenarios)
+  --min-alleles=N       Least number of alleles with --adaptive-alleles         [Default: 10]
+  --allele-batch=N      Alleles per batch with --adaptive-alleles               [Default: 5]
+  --allele-tolerance=T  Largest change of every estimate over the last batch 
+                        (relative if above 1) to stop at                        [Default: 0.01]
+  --keep-scenarios      Keep every step of every scenario in memory till the 
+                        profile is aggregated (for debugging)
   -s, --seed=SEED       Randomization seed      [Default: 12345]
+  --enumeration-cache=EFOLDER   Folder to save exhaustive enumerations of voters 
+                                placements in, and load them from later runs
+  --checkpoint=CFILE    Save the results so far and the seeds schedule to 
+                        CFILE after every round
+  --resume              Continue the run saved in the checkpoint file, 
+                        instead of starting again from the seed
+  --comm=BACKEND        How ranks communicate (auto | mpi | serial). auto: 
+                        MPI if mpi4py is installed, else one process            [Default: auto]
+  --results=RFILE       Save the final results to RFILE, to plot them again 
+                        later with plot.py
+  --no-graphs           Don't generate the graphs at the end of the run
   --show                Show results
   -h, --help            Print the help screen
   --version             Prints the version and exits
@@ -187,10 +691,9 @@ Options:
     args = docopt(doc, version='0.1.0')
     # print(args)
     seed = int(args['--seed'])
-    all_simulations_per_all_seeds = dict()
     log = None
 
-    comm = MPI.COMM_WORLD
+    comm = get_comm(args['--comm'])
     if comm.Get_rank() == 0:
         log_arg = args['--log']
         if log_arg == '-':
@@ -206,133 +709,555 @@ Options:
     # print('exhaustive =', exhaustive)
     if exhaustive and 'general' == (args.get('--preference', None)):
         raise TypeError('Exhaustive search can be performed only with single-peaked preference (till now).')
-
-    all_previously_run = dict()  # To hold all runs from all seeds simulated on all threads
+    if int(args['--cmax']) > MAX_CANDIDATES:
+        raise TypeError(f'--cmax must be at most {MAX_CANDIDATES}: measurements keep sets of candidates as '
+                        f'{MAX_CANDIDATES} bit masks.')
+    if args['--adaptive-alleles'] and ('lockstep' == args['--engine'] or args['--keep-scenarios']):
+        raise TypeError('--adaptive-alleles works only with the sequential (or exact) engine, without '
+                        '--keep-scenarios.')
+    if int(args['--max-alleles']) < 1:
+        raise TypeError('--max-alleles must be at least 1.')
+    if args['--adaptive-alleles'] and not (1 <= int(args['--min-alleles']) <= int(args['--max-alleles'])):
+        raise TypeError('--min-alleles must be at least 1, and at most --max-alleles.')
+    if args['--adaptive-alleles'] and int(args['--allele-batch']) < 1:
+        raise TypeError('--allele-batch must be at least 1.')
+
+    all_previously_run = MeasurementStore()  # To hold all runs from all seeds simulated on all threads
+    convergence_columns = ConvergenceColumns()  # of all_previously_run, for the convergence test
     seeds__rank = comm.Get_rank()
     seeds__num_processors = comm.Get_size()
     seeds__all_previously_run_count = 0
     seeds__run_base = seed
     seeds__run_size = int(args['--initial-run-size'])
 
-    target_measurements = [
-        ('percentage_winner_is_weak_condorcet', False), ('percentage_winner_is_strong_condorcet', False),
-        ('percentage_truthful_winner_wins', False), ('percentage_of_convergence', False),
-        ('average_time_to_convergence', False), ('average_social_welfare', False),
-        ('stable_states_sets', True), ('winning_sets', True)
-    ]
+    if args.get('--enumeration-cache'):
+        args['enumeration_cache'] = EnumerationCache(args['--enumeration-cache'])
 
-    more_work = True
+    # In cells mode, the units of work are (seed, (n_candidates, n_voters)) pairs, scheduled by their measured costs
+    cell_costs = CellCosts()
 
-    while more_work:
-        seeds__chunk_size = int(math.ceil(seeds__run_size / seeds__num_processors))
-        seeds__chunk_base = seeds__run_base + (seeds__rank * seeds__chunk_size)  # inclusive
-        seeds__chunk_end = min((seeds__chunk_base + seeds__chunk_size), (seeds__run_base + seeds__run_size))  # excl
-        # print(seeds__run_size, seeds__rank, seeds__run_base, seeds__run_size, seeds__chunk_size, seeds__chunk_base)
+    checkpoint_path = args.get('--checkpoint')
+    if args.get('--resume'):
+        if not checkpoint_path:
+            raise TypeError('--resume needs the --checkpoint file to resume from.')
         if seeds__rank == 0:
-            msg = f'going to start a run of {seeds__run_size} on {seeds__num_processors} batches, ' \
-                f'{seeds__chunk_size} runs each'
-            log.write(msg + '\n')
-            log.write(f'Thread {seeds__rank} starts with seed {seeds__chunk_base} (in) to {seeds__chunk_end} (ex)\n')
+            checkpoint = load_checkpoint(checkpoint_path, args)
+            all_previously_run.append(checkpoint['results'])
+            cell_costs.seconds = checkpoint['cell_costs']
+            log.write(f"resuming from {checkpoint_path}: {len(all_previously_run)} seeds already run\n")
             log.flush()
+            schedule = (checkpoint['run_base'], checkpoint['run_size'], checkpoint['all_previously_run_count'],
+                        cell_costs)
+        else:
+            schedule = None
+        # The other ranks only need to know where the schedule stopped, not the results
+        seeds__run_base, seeds__run_size, seeds__all_previously_run_count, cell_costs = comm.bcast(schedule, root=0)
 
-        for assigned_seed in range(seeds__chunk_base, seeds__chunk_end):
-            out_path = os.path.join(args['--out-folder'], f'out-{assigned_seed:05}.log')
-            if not os.path.exists(out_path):
-                os.makedirs(os.path.dirname(out_path), exist_ok=True)
-            out = open(out_path, 'w')
-
-            # to be run in a separate MPI process or node
-            args["assigned_seed"] = assigned_seed
-            args['log'] = log
-            args['out'] = out
-            all_simulations_per_all_seeds[assigned_seed] = run_all_simulations_per_seed(args)
-            out.close()
-        # collect the simulations results from several threads
-        buffer = comm.gather(all_simulations_per_all_seeds, root=0)
+    target_measurements = TARGET_MEASUREMENTS
+
+    # In dynamic mode, rank 0 only hands out seeds to the other ranks. It needs at least one of them.
+    dynamic = 'dynamic' == args.get('--schedule', 'static') and seeds__num_processors > 1
+    cells = 'cells' == args.get('--schedule', 'static')
+
+    more_work = True
+
+    while more_work:
+        if dynamic:
+            seeds__run_range = range(seeds__run_base, seeds__run_base + seeds__run_size)
+            if seeds__rank == 0:
+                log.write(f'going to start a run of {seeds__run_size} on {seeds__num_processors - 1} workers, '
+                          f'one seed at a time\n')
+                log.flush()
+                # collect the simulations results from the workers as they finish them
+                with TIMERS.phase('communication'):
+                    buffer = serve_seeds(comm, seeds__run_range)
+            else:
+                request_seeds(comm, lambda assigned_seed: run_seed(args, assigned_seed, log))
+                buffer = None
+        elif cells:
+            seeds__run_range = range(seeds__run_base, seeds__run_base + seeds__run_size)
+            units = [(assigned_seed, cell) for assigned_seed in seeds__run_range for cell in grid_cells(args)]
+            # Every rank computes the same schedule, from the same costs
+            rank_units = schedule_units(units, cell_costs, seeds__num_processors)
+            if seeds__rank == 0:
+                log.write(f'going to start a run of {seeds__run_size} seeds, {len(units)} units on '
+                          f'{seeds__num_processors} ranks\n')
+                if cell_costs.seconds:
+                    loads = [sum(cell_costs.estimate(cell) for _, cell in units) for units in rank_units]
+                    log.write(f'estimated seconds per rank: min {min(loads):.3f}, max {max(loads):.3f}\n')
+                log.flush()
+
+            all_simulations_per_all_seeds = dict()  # only this round's units are sent
+            timings = []
+            for assigned_seed, cell in rank_units[seeds__rank]:
+                start = time.perf_counter()
+                all_simulations_per_all_seeds.setdefault(assigned_seed, []).append(
+                    run_unit(args, assigned_seed, cell, log))
+                timings.append((cell, time.perf_counter() - start))
+            packed = pack_measurements(all_simulations_per_all_seeds)
+            with TIMERS.phase('communication'):
+                buffer = comm.gather((packed, timings), root=0)
+            if seeds__rank == 0:
+                for _, rank_timings in buffer:
+                    for cell, seconds in rank_timings:
+                        cell_costs.add(cell, seconds)
+                buffer = [packed for packed, _ in buffer]
+            with TIMERS.phase('communication'):
+                cell_costs = comm.bcast(cell_costs, root=0)
+        else:
+            seeds__chunk_size = int(math.ceil(seeds__run_size / seeds__num_processors))
+            seeds__chunk_base = seeds__run_base + (seeds__rank * seeds__chunk_size)  # inclusive
+            seeds__chunk_end = min((seeds__chunk_base + seeds__chunk_size), (seeds__run_base + seeds__run_size))  # ex
+            # print(seeds__run_size, seeds__rank, seeds__run_base, seeds__run_size, seeds__chunk_size, seeds__chunk_base)
+            if seeds__rank == 0:
+                msg = f'going to start a run of {seeds__run_size} on {seeds__num_processors} batches, ' \
+                    f'{seeds__chunk_size} runs each'
+                log.write(msg + '\n')
+                log.write(f'Thread {seeds__rank} starts with seed {seeds__chunk_base} (in) to {seeds__chunk_end} (ex)\n')
+                log.flush()
+
+            all_simulations_per_all_seeds = dict()  # only this round's seeds are sent
+            for assigned_seed in range(seeds__chunk_base, seeds__chunk_end):
+                # to be run in a separate MPI process or node
+                all_simulations_per_all_seeds[assigned_seed] = run_seed(args, assigned_seed, log)
+            # collect the simulations results from several threads
+            packed = pack_measurements(all_simulations_per_all_seeds)
+            with TIMERS.phase('communication'):
+                buffer = comm.gather(packed, root=0)
         if seeds__rank == 0:
             # Add all (gather new) values
-            for returned_dict in buffer:  # [{seed, [measurements, ...]}, ...]
-                for key in iter(returned_dict):
-                    all_previously_run[key] = returned_dict[key]
-
-            # sort results
-            all_measurements_by_candidates, all_measurements_by_voters = sort_measurements(all_previously_run)
-
-            # check for convergence
-            more_work = not (
-                    run_converged(all_measurements_by_candidates, seeds__all_previously_run_count, target_measurements,
-                                  max_sum_abs_diffs=float(args['--conv-threshold']))
-                    and
-                    run_converged(all_measurements_by_voters, seeds__all_previously_run_count, target_measurements,
-                                  max_sum_abs_diffs=float(args['--conv-threshold']))
-            )
+            for packed in buffer:  # [packed {seed, [measurements, ...]}, ...]
+                all_previously_run.append(packed)
+
+            # check for convergence. By candidates or by voters, the cells are the same.
+            with TIMERS.phase('convergence'):
+                more_work = not run_converged(all_previously_run, seeds__all_previously_run_count,
+                                              target_measurements, max_sum_abs_diffs=float(args['--conv-threshold']),
+                                              columns=convergence_columns)
 
             if not more_work:
+                if args.get('--results'):
+                    save_results(args['--results'], args, all_previously_run)
                 # generate graph(s)
-                generate_graphs(all_measurements_by_candidates, all_measurements_by_voters, target_measurements,
-                                args['--out-folder'])
+                if not args.get('--no-graphs'):
+                    with TIMERS.phase('plotting'):
+                        generate_graphs(all_previously_run, target_measurements, args['--out-folder'])
         else:
             more_work = None
-        more_work = comm.bcast(more_work, root=0)
+        with TIMERS.phase('communication'):
+            more_work = comm.bcast(more_work, root=0)
         # print(f'Thread {seeds__rank} more work =', more_work, flush=True)
 
         seeds__run_base += seeds__run_size
         seeds__run_size = int(math.ceil((seeds__run_size + seeds__all_previously_run_count) / 2))
         if seeds__rank == 0:
             seeds__all_previously_run_count = len(all_previously_run)
-        seeds__all_previously_run_count = comm.bcast(seeds__all_previously_run_count, root=0)
+        with TIMERS.phase('communication'):
+            seeds__all_previously_run_count = comm.bcast(seeds__all_previously_run_count, root=0)
+
+        snapshots = comm.gather(timers_snapshot(), root=0)
+        if seeds__rank == 0:
+            log.write(f'Timers of the round, over {len(snapshots)} rank(s):\n{summarize(snapshots)}\n')
+            log.flush()
+
+        if checkpoint_path and more_work and seeds__rank == 0:
+            save_checkpoint(checkpoint_path, args, all_previously_run, seeds__run_base, seeds__run_size,
+                            seeds__all_previously_run_count, cell_costs)
 
     if seeds__rank == 0:
         log.write("Done.\n")
         log.flush()
         log.close()
-        if bool(args['--show']):
+        if bool(args['--show']) and not args.get('--no-graphs'):
+            import matplotlib.pyplot as plt
             plt.show()
 
 
-def run_converged(all_measurements_sorted: dict, seeds_all_previously_run_count: int, target_measurements: list,
-                  max_sum_abs_diffs=0.10
+# (attribute name, use its len) of the measurements tested for convergence and plotted
+TARGET_MEASUREMENTS = [
+    ('percentage_winner_is_weak_condorcet', False), ('percentage_winner_is_strong_condorcet', False),
+    ('percentage_truthful_winner_wins', False), ('percentage_of_convergence', False),
+    ('average_time_to_convergence', False), ('average_social_welfare', False),
+    ('stable_states_sets', True), ('winning_sets', True)
+]
+
+
+class SerialComm:
+    """The few calls of an MPI communicator main() makes, for a single process run without MPI"""
+
+    def Get_rank(self) -> int:
+        return 0
+
+    def Get_size(self) -> int:
+        return 1
+
+    def gather(self, sendobj, root=0) -> list:
+        return [sendobj]
+
+    def bcast(self, obj, root=0):
+        return obj
+
+
+def get_comm(backend: str = 'auto'):
+    """The communicator of the ranks of this run. mpi4py is imported only here (or not at all).
+
+    :param backend: mpi, serial, or auto: mpi if mpi4py is installed, else serial
+    """
+    if backend == 'serial':
+        return SerialComm()
+    try:
+        from mpi4py import MPI
+    except ImportError:
+        if backend == 'mpi':
+            raise
+        return SerialComm()
+    return MPI.COMM_WORLD
+
+
+# Options that change the simulated measurements. A run can be resumed only with the same ones.
+CHECKPOINT_OPTIONS = ('--cmin', '--cmax', '--vmin', '--vmax', '--random-search', '--utility', '--preference',
+                      '--tiebreakingrule', '--voters', '--schedule', '--detect-cycles', '--engine',
+                      '--exact-max-states', '--max-alleles', '--adaptive-alleles', '--min-alleles', '--allele-batch',
+                      '--allele-tolerance', '<BASE>', '<EXPO_STEP>')
+
+
+# Version of the layout of checkpoint and results files (packed rows, random streams). Bumped on every change, so
+# that files of another version are rejected instead of being misread or silently mixed with new seeds.
+RESULTS_VERSION = 2
+
+
+def measured_options(args) -> dict:
+    """The CHECKPOINT_OPTIONS of a run, as they affect its measurements"""
+    options = {option: args.get(option) for option in CHECKPOINT_OPTIONS}
+    # The static and dynamic schedules draw the cells of a seed from the same random stream, unlike the cells one
+    if options['--schedule'] != 'cells':
+        options['--schedule'] = 'static'
+    # Options that take no effect are recorded as None, so that they do not tell apart runs of the same measurements
+    if options['--engine'] != 'exact':
+        options['--exact-max-states'] = None
+    if options['--engine'] == 'lockstep':
+        options['--detect-cycles'] = None
+    if not options['--adaptive-alleles']:
+        options['--min-alleles'] = options['--allele-batch'] = options['--allele-tolerance'] = None
+    return options
+
+
+def save_checkpoint(path: str, args, all_previously_run: MeasurementStore, run_base: int, run_size: int,
+                    all_previously_run_count: int, cell_costs: 'CellCosts' = None) -> None:
+    """Save the state of the convergence loop of main() at the end of a round, see load_checkpoint().
+
+    The file is replaced atomically, so a job killed while writing it leaves the previous checkpoint intact. The
+    convergence test needs nothing but the results (see ConvergenceColumns).
+    :param path: the checkpoint file
+    :param args: the command line arguments, to check the resumed run simulates the same thing
+    :param all_previously_run: the measurements of all seeds run so far
+    :param run_base: first seed of the next round
+    :param run_size: number of seeds of the next round
+    :param all_previously_run_count: number of seeds run before the next round
+    :param cell_costs: the measured costs of the cells so far, which the cells schedule of the next rounds depends on
+    """
+    dump_atomically(path, {
+        'version': RESULTS_VERSION,
+        'options': measured_options(args),
+        'results': all_previously_run.packed(),
+        'run_base': run_base,
+        'run_size': run_size,
+        'all_previously_run_count': all_previously_run_count,
+        'cell_costs': cell_costs.seconds if cell_costs is not None else dict(),
+    })
+
+
+def save_results(path: str, args, all_previously_run: MeasurementStore) -> None:
+    """Save the measurements of a finished run, to be plotted by plot.py. See load_results().
+
+    :param path: the results file
+    :param args: the command line arguments, saved with the results
+    :param all_previously_run: the measurements of all seeds
+    """
+    dump_atomically(path, {
+        'version': RESULTS_VERSION,
+        'options': measured_options(args),
+        'results': all_previously_run.packed(),
+    })
+
+
+def load_results(path: str) -> MeasurementStore:
+    """The measurements saved by save_results() or save_checkpoint()"""
+    with open(path, 'rb') as results_file:
+        saved = pickle.load(results_file)
+    check_version(path, saved)
+    store = MeasurementStore()
+    store.append(saved['results'])
+    return store
+
+
+def check_version(path: str, saved: dict) -> None:
+    """Reject a file saved by save_checkpoint() or save_results() with another RESULTS_VERSION"""
+    version = saved.get('version')
+    if version != RESULTS_VERSION:
+        saved_with = f'version {version}' if version is not None else 'an unversioned release'
+        raise TypeError(f'Can not read {path}: it was saved with {saved_with} of the results format, this is version '
+                        f'{RESULTS_VERSION}. Run it again, or read it with the version of engine.py that saved it.')
+
+
+def dump_atomically(path: str, obj) -> None:
+    """Pickle obj to path through a temporary file, so a job killed while writing it leaves the previous file intact"""
+    dirname = os.path.dirname(path)
+    if dirname != '':
+        os.makedirs(dirname, exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as temp_file:
+        pickle.dump(obj, temp_file)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+    os.replace(temp_path, path)
+
+
+def load_checkpoint(path: str, args) -> dict:
+    """Load a checkpoint written by save_checkpoint()
+
+    :param path: the checkpoint file
+    :param args: the command line arguments. The options that change the measurements must be the saved ones.
+    :return: the saved checkpoint dict
+    """
+    with open(path, 'rb') as checkpoint_file:
+        checkpoint = pickle.load(checkpoint_file)
+    check_version(path, checkpoint)
+    options = measured_options(args)
+    for option in CHECKPOINT_OPTIONS:
+        if option not in checkpoint['options']:
+            raise TypeError(f'Can not resume {path}: it does not record {option}.')
+        saved = checkpoint['options'][option]
+        if options[option] != saved:
+            raise TypeError(f'Can not resume {path}: it was run with {option} {saved}, not {options[option]}.')
+    return checkpoint
+
+
+def run_seed(args, assigned_seed: int, log) -> list:
+    """Run all simulations of one seed, writing its scenarios to its own out file."""
+    out_path = os.path.join(args['--out-folder'], f'out-{assigned_seed:05}.log')
+    if not os.path.exists(out_path):
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    out = open(out_path, 'w')
+
+    args["assigned_seed"] = assigned_seed
+    args['log'] = log
+    args['out'] = out
+    result = run_all_simulations_per_seed(args)
+    out.close()
+    TIMERS.count('seeds')
+    return result
+
+
+def run_unit(args, assigned_seed: int, cell: tuple, log) -> Measurements:
+    """Run one (seed, cell) unit of the cells schedule, writing its scenarios to its own out file."""
+    out_path = os.path.join(args['--out-folder'], f'out-{assigned_seed:05}-{cell[0]}-{cell[1]}.log')
+    if not os.path.exists(out_path):
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    out = open(out_path, 'w')
+
+    args["assigned_seed"] = assigned_seed
+    args['log'] = log
+    args['out'] = out
+    memo_size = int(args.get('--memo-size') or 0)
+    memo = BestResponseMemo(memo_size) if memo_size else None
+    result = run_cell(args, cell, memo)
+    if memo is not None:
+        out.write(f'\nBest response memo: {memo}\n')
+    out.close()
+    TIMERS.count('units')
+    return result
+
+
+class CellCosts:
+    """Measured wall time of the (n_candidates, n_voters) cells, to estimate the cost of the units of the next rounds"""
+
+    def __init__(self):
+        self.seconds = dict()  # cell -> [sum of seconds, number of units]
+
+    def add(self, cell: tuple, seconds: float) -> None:
+        total = self.seconds.setdefault(cell, [0.0, 0])
+        total[0] += seconds
+        total[1] += 1
+
+    def estimate(self, cell: tuple) -> float:
+        """Mean measured seconds of the cell. A cell not measured yet is assumed to cost in proportion to
+        n_candidates ** 2 * n_voters (up to n_candidates * n_voters steps, each looking at the candidates), scaled to
+        the measured cells if any."""
+        if cell in self.seconds:
+            total, count = self.seconds[cell]
+            return total / count
+        measured = [(total / count, n_candidates ** 2 * n_voters)
+                    for (n_candidates, n_voters), (total, count) in self.seconds.items()]
+        scale = sum(seconds for seconds, _ in measured) / sum(proxy for _, proxy in measured) if measured else 1e-6
+        return cell[0] ** 2 * cell[1] * scale
+
+
+def schedule_units(units: list, costs: CellCosts, n_ranks: int) -> list:
+    """Longest processing time first: every unit, the costliest first, goes to the least loaded rank so far.
+
+    :param units: (seed, cell) pairs
+    :param costs: the estimated cost of every cell
+    :param n_ranks: number of ranks
+    :return: the units of every rank, by rank, in the order to run them (the costliest first)
+    """
+    rank_units = [[] for _ in range(n_ranks)]
+    loads = [(0.0, rank) for rank in range(n_ranks)]  # a heap
+    for unit in sorted(units, key=lambda unit: costs.estimate(unit[1]), reverse=True):
+        load, rank = heapq.heappop(loads)
+        rank_units[rank].append(unit)
+        heapq.heappush(loads, (load + costs.estimate(unit[1]), rank))
+    return rank_units
+
+
+SEEDS_TAG = 1
+
+
+def serve_seeds(comm, seeds: range) -> list:
+    """Master side of the dynamic schedule: hand out seeds, one at a time, to whichever worker asks first.
+
+    Every request of a worker carries the packed result of its previous seed (if any), see pack_measurements(). Once
+    no seeds are left, every worker is answered with None, which ends its round.
+    :param comm: the MPI communicator. This is rank 0, and all other ranks are workers.
+    :param seeds: the seeds of this round
+    :return: the packed results of all seeds of the round, see pack_measurements()
+    """
+    from mpi4py import MPI
+    results = []
+    pending = iter(seeds)
+    n_workers = comm.Get_size() - 1
+    status = MPI.Status()
+    while n_workers:
+        packed = comm.recv(source=MPI.ANY_SOURCE, tag=SEEDS_TAG, status=status)
+        if packed is not None:
+            results.append(packed)
+        next_seed = next(pending, None)
+        comm.send(next_seed, dest=status.Get_source(), tag=SEEDS_TAG)
+        if next_seed is None:
+            n_workers -= 1
+    return results
+
+
+def request_seeds(comm, run) -> None:
+    """Worker side of the dynamic schedule: keep asking rank 0 for seeds, and send back their results, till it answers
+    with None.
+
+    :param comm: the MPI communicator
+    :param run: callable taking a seed and returning its list of measurements
+    """
+    packed = None
+    while True:
+        with TIMERS.phase('communication'):
+            comm.send(packed, dest=0, tag=SEEDS_TAG)
+            assigned_seed = comm.recv(source=0, tag=SEEDS_TAG)
+        if assigned_seed is None:
+            return
+        packed = pack_measurements({assigned_seed: run(assigned_seed)})
+
+
+def run_converged(all_previously_run: MeasurementStore, seeds_all_previously_run_count: int,
+                  target_measurements: list, max_sum_abs_diffs=0.10, columns: 'ConvergenceColumns' = None
                   # , extremities=0.05
                   ) -> bool:
+    """Test whether every target measurement of every cell has a similar distribution over the old seeds and over
+    all seeds.
+
+    :param all_previously_run: the measurements of all seeds, the old ones first
+    :param seeds_all_previously_run_count: the number of old seeds
+    :param target_measurements: (attribute name, use its len) pairs
+    :param columns: the values of the previous rounds, extended here with the new rows only. If None, they are taken
+        from all the rows.
+    """
     # print('=============================')
+    if columns is None:
+        columns = ConvergenceColumns()
+    columns.update(all_previously_run, target_measurements)
     if not seeds_all_previously_run_count:
         return False
     for attr_name, len_attr in target_measurements:
-        for level1 in all_measurements_sorted.items():
-            for level2 in level1[1].items():
-                msrmnt_lst = level2[1]
-                old_values = [
-                    len(operator.attrgetter(attr_name)(msrmnt)) if len_attr else operator.attrgetter(attr_name)(msrmnt)
-                    for msrmnt in msrmnt_lst[:seeds_all_previously_run_count]
-                ]
-                current_values = [
-                    len(operator.attrgetter(attr_name)(msrmnt)) if len_attr else operator.attrgetter(attr_name)(msrmnt)
-                    for msrmnt in msrmnt_lst
-                ]
-                # After much consideration, I simply decided to take the wider distribution and apply it
-                # to the smaller one (the subset) keeping the same bin boundaries.
-                # len_extremity = int(len(current_values) * extremities / 2)
-                # old_values_barred = current_values[len_extremity: -1-len_extremity]
-                # lbound = current_values[len_extremity]
-                # ubound = current_values[-1 - len_extremity]
-
-                current_hist, edges = np.histogram(current_values, bins='auto', density=True)
-                # print(level1[0], level2[0], attr_name, current_values)
-                # print(edges, np.diff(edges), current_hist, flush=True)
-                old_hist, edges = np.histogram(old_values, bins=edges, density=True)
-                diff_edges = np.diff(edges)
-                # print(np.multiply(old_hist, diff_edges))
-                # print(np.multiply(current_hist, diff_edges))
-                subtract = np.subtract(np.multiply(old_hist, diff_edges), np.multiply(current_hist, diff_edges))
-                sum_abs_diffs = np.sum(abs(subtract))
-                # print(subtract, np.abs(subtract), sum_abs_diffs)
-                if sum_abs_diffs > max_sum_abs_diffs:
-                    return False
+        for cell in all_previously_run.cells:
+            # After much consideration, I simply decided to take the wider distribution and apply it
+            # to the smaller one (the subset) keeping the same bin boundaries.
+            # len_extremity = int(len(current_values) * extremities / 2)
+            # old_values_barred = current_values[len_extremity: -1-len_extremity]
+            # lbound = current_values[len_extremity]
+            # ubound = current_values[-1 - len_extremity]
+
+            current_values = columns.values(cell, attr_name)
+            old_values = current_values[:seeds_all_previously_run_count]
+            if histograms_distance(old_values, current_values) > max_sum_abs_diffs:
+                return False
     else:
         print('============> Run Converged <============', flush=True)
         return True
 
 
+def histograms_distance(old_values: np.ndarray, current_values: np.ndarray) -> float:
+    """Sum of absolute differences between the (normalized) histograms of old and current values, with the 'auto' bins
+    of the current (wider) ones"""
+    current_hist, edges = np.histogram(current_values, bins='auto', density=True)
+    old_hist, edges = np.histogram(old_values, bins=edges, density=True)
+    diff_edges = np.diff(edges)
+    subtract = np.subtract(np.multiply(old_hist, diff_edges), np.multiply(current_hist, diff_edges))
+    return np.sum(abs(subtract))
+
+
+class ConvergenceColumns:
+    """Contiguous values of the target measurements of every cell, kept by rank 0 from round to round for
+    run_converged().
+
+    Every round, only the rows added since the previous round are copied in, and the old seeds stay the first values of
+    every cell. The histograms themselves are built again every round, since their 'auto' bins depend on all the
+    values. They depend on nothing else, so a resumed run, which copies in all the stored rows at once, takes the same
+    decisions as a run that was never interrupted.
+    """
+
+    def __init__(self):
+        self.columns = dict()  # (cell, attribute name) -> [values, number of them]
+
+    def update(self, all_previously_run: MeasurementStore, target_measurements: list) -> None:
+        """Copy in the rows added since the previous update
+
+        :param all_previously_run: the measurements of all seeds
+        """
+        for attr_name, len_attr in target_measurements:
+            for cell in all_previously_run.cells:
+                column = self.columns.setdefault((cell, attr_name), [None, 0])
+                new_values = all_previously_run.column(cell, attr_name, column[1])
+                if column[0] is None:
+                    # the number of sets is counted with Python ints, which numpy bins as int64
+                    dtype = np.int64 if np.issubdtype(new_values.dtype, np.integer) else np.float64
+                    column[0] = np.zeros(0, dtype=dtype)
+                if column[1] + len(new_values) > len(column[0]):
+                    grown = np.zeros(max(16, 2 * (column[1] + len(new_values))), dtype=column[0].dtype)
+                    grown[:column[1]] = column[0][:column[1]]
+                    column[0] = grown
+                column[0][column[1]:column[1] + len(new_values)] = new_values
+                column[1] += len(new_values)
+
+    def values(self, cell: tuple, attr_name: str) -> np.ndarray:
+        """Values of one attribute in one cell, in arrival order"""
+        values, length = self.columns[(cell, attr_name)]
+        return values[:length]
+
+
+# Exhaustive enumerations of all seeds run in this process, unless main() was given a folder to keep them in
+ENUMERATIONS = EnumerationCache()
+
+# Phases and counters of this rank, summarized on rank 0 at the end of every round of main()
+TIMERS = PhaseTimers()
+
+
+def timers_snapshot() -> dict:
+    """This rank's timers and counters since the previous snapshot, which resets them"""
+    for name, n in CALLS.items():
+        TIMERS.count(name, n)
+        CALLS[name] = 0
+    snapshot = TIMERS.snapshot()
+    TIMERS.reset()
+    return snapshot
+
+
 def run_all_simulations_per_seed(args) -> list:
     """Run different candidates numbers [5-7]* different voters numbers [cmin -12]* 50 repeat
 
@@ -340,90 +1265,221 @@ def run_all_simulations_per_seed(args) -> list:
     :return: list of measures, one for every profile (candidates/voters/preferences)
     """
     out = args['out']
+    memo_size = int(args.get('--memo-size') or 0)
+    memo = BestResponseMemo(memo_size) if memo_size else None
+    rand = Random(args['assigned_seed'])
+    exhaustive = not bool(args['--random-search'])
+    cells = grid_cells(args)
+    all_profiles_measurements = []
+    for n_candidates in range(int(args['--cmin']), int(args['--cmax']) + 1):
+        # The cells of a number of candidates share its candidates, drawn once (with the gaps of run_cell())
+        all_candidates = generate_candidates(n_candidates, exhaustive, rand)
+        all_profiles_measurements.extend(run_cell(args, cell, memo, rand, all_candidates)
+                                         for cell in cells if cell[0] == n_candidates)
+    if memo is not None:
+        out.write(f'\nBest response memo: {memo}\n')
+        out.flush()
+    return all_profiles_measurements
+
+
+def grid_cells(args) -> list:
+    """The (n_candidates, n_voters) cells of every seed, in the order run_all_simulations_per_seed() runs them"""
+    cmin = int(args['--cmin'])
+    cmax = int(args['--cmax'])
+    # vmin = int(args['--vmin'])
+    vmin = cmin if 'cmin' == args['--vmin'] else int(args['--vmin'])
+    vmax = int(args['--vmax'])
+    # number of n_candidates <= n_voters <= 12
+    return [(n_candidates, n_voters) for n_candidates in range(cmin, cmax + 1)
+            for n_voters in range(max(vmin, n_candidates), vmax + 1) if not n_voters % 2]
+
+
+def cell_random(assigned_seed: int, cell: tuple) -> Random:
+    """The source of randomness of one cell of one seed, in the cells schedule. Cells do not share it, so a cell gives
+    the same measurements whichever cells ran before it, and on whichever rank."""
+    n_candidates, n_voters = cell
+    return Random(f'{assigned_seed}/{n_candidates}/{n_voters}')
+
+
+def run_cell(args, cell: tuple, memo: BestResponseMemo = None, rand: Random = None,
+             all_candidates: list = None) -> Measurements:
+    """Run the alleles of the profile of one (n_candidates, n_voters) cell of a seed
+
+    :param args: all arguments after adjusting THIS suit seed
+    :param cell: (n_candidates, n_voters)
+    :param memo: best responses memo to register the voters in, if any
+    :param rand: the source of randomness of the seed, which its cells draw from one after the other (static and
+        dynamic schedules). If None, the cell's own, see cell_random().
+    :param all_candidates: the candidates, if already drawn from rand. If None, they are drawn here.
+    """
+    out = args['out']
     log = args['log']
     assigned_seed = args['assigned_seed']
+    n_candidates, n_voters = cell
     utility = {
         'borda': BordaUtility(),
         'expo': ExpoUtility(base=args['<BASE>'] if args['<BASE>'] else 2,
                             exponent_step=args['<EXPO_STEP>'] if args['<EXPO_STEP>'] else  1),
     }.get(args['--utility'], None)
-    cmin = int(args['--cmin'])
-    cmax = int(args['--cmax'])
-    # vmin = int(args['--vmin'])
-    vmin = cmin if 'cmin' == args['--vmin'] else int(args['--vmin'])
-    vmax = int(args['--vmax'])
-    rand = random.Random(assigned_seed)
+    if rand is None:
+        rand = cell_random(assigned_seed, cell)
     exhaustive = not bool(args['--random-search'])  # duplicate code of the outer line
+    compact = bool(args.get('--compact', False))
+    lockstep = 'lockstep' == args.get('--engine', 'sequential')
+    exact_max_states = int(args.get('--exact-max-states') or 20_000) \
+        if 'exact' == args.get('--engine', 'sequential') else 0
+    keep_scenarios = bool(args.get('--keep-scenarios', False))
+    detect_cycles = bool(args.get('--detect-cycles', False))
+    max_alleles = int(args.get('--max-alleles') or 50)
+    adaptive = (int(args.get('--min-alleles') or 10), int(args.get('--allele-batch') or 5),
+                float(args.get('--allele-tolerance') or 0.01)) if args.get('--adaptive-alleles') else None
+    enumerations = args.get('enumeration_cache', ENUMERATIONS)
     preference = {
         'single-peaked': SinglePeakedProfilePreference(),
         'general': GeneralProfilePreference(rand),
     }.get(args['--preference'], None)
+
+    # Generate deterministic list of candidates
+    terminal_gap = False
+    inter_gaps = True
+    if all_candidates is None:
+        all_candidates = generate_candidates(n_candidates, exhaustive, rand, terminal_gap, inter_gaps)
+    # print(n_candidates, all_candidates, flush=True)
+
     tie_breaking_rule = {
-        'lexicographic': LexicographicTieBreakingRule(),
+        'lexicographic': LexicographicTieBreakingRule(all_candidates),
         'random': RandomTieBreakingRule(rand),
     }.get(args['--tiebreakingrule'], None)
     # print(utility, preference, tie_breaking_rule)
-    all_profiles_measurements = []
-    n_candidates_range = range(cmin, cmax + 1)
-    for n_candidates in n_candidates_range:
-        # Generate deterministic list of candidates
-        terminal_gap = False
-        inter_gaps = True
-        all_candidates = generate_candidates(n_candidates, exhaustive, rand, terminal_gap, inter_gaps)
-        # print(n_candidates, all_candidates, flush=True)
 
-        # number of n_candidates <= n_voters <= 12
-        n_voters_range = range(max(vmin, n_candidates), vmax + 1)
-        for n_voters in n_voters_range:
-            if n_voters % 2:
-                continue
+    out.write(f'\n------------ voters = {n_voters}, Candidates = {n_candidates}-------------------\n')
+    out.flush()
+    # log.write(f'\n------------ voters = {n_voters}, Candidates = {n_candidates}-------------------\n')
+
+    if exhaustive:
+        # Generate deterministic list of voters
+        # adjust bins acc to terminal and internal gaps
+        terminal = 1 if terminal_gap else 0
+        delta = 2 if inter_gaps else 1
+        last_bin = terminal + (n_candidates * delta)
+        if terminal and not inter_gaps:
+            last_bin += 1
+        # The enumeration of permute_identityless() is shared by all seeds of this rank (and runs)
+        n_placements = enumerations.count(last_bin, n_voters, False)
+        # print('len = ', n_placements, flush=True)
+
+    # Use it :)
+    determinant = enumerations.placement(list(range(last_bin)), n_voters, assigned_seed % n_placements, False) \
+        if exhaustive else rand
+
+    all_voters = generate_voters(n_voters, args['--voters'], utility, determinant)
+    # print(all_voters, flush=True)
+
+    # voters build their preferences
+    with TIMERS.phase('profiles'):
+        for voter in all_voters:
+            voter.build_profile(all_candidates, preference, compact)
+            if memo is not None:
+                memo.register(voter)
+        # collective profile
+        profile = [voter.getprofile() for voter in all_voters]
+        initial_status = Status.from_profile(profile, compact)
 
-            out.write(f'\n------------ voters = {n_voters}, Candidates = {n_candidates}-------------------\n')
-            out.flush()
-            # log.write(f'\n------------ voters = {n_voters}, Candidates = {n_candidates}-------------------\n')
-
-            if exhaustive:
-                # Generate deterministic list of voters
-                # adjust bins acc to terminal and internal gaps
-                terminal = 1 if terminal_gap else 0
-                delta = 2 if inter_gaps else 1
-                last_bin = terminal + (n_candidates * delta)
-                if terminal and not inter_gaps:
-                    last_bin += 1
-                deterministic_list_of_voters_choices = permute_identityless(list(range(last_bin)), n_voters, False, list())
-                # print('len = ', len(deterministic_list_of_voters_choices), deterministic_list_of_voters_choices, flush=True)
-                
-
-            # Use it :)
-            determinant = deterministic_list_of_voters_choices[assigned_seed % len(deterministic_list_of_voters_choices)] if exhaustive else rand
-
-            all_voters = generate_voters(n_voters, args['--voters'], utility, determinant)
-            # print(all_voters, flush=True)
-
-            # voters build their preferences
-            for voter in all_voters:
-                voter.build_profile(all_candidates, preference)
-            # collective profile
-            profile = [voter.getprofile() for voter in all_voters]
-            initial_status = Status.from_profile(profile)
-
-            # print(n_candidates, n_voters, assigned_seed, all_voters, flush=True)
-            # continue  # FIXME for development purpose only
-            streams = {'log': log, 'out': out}
-            measurements = run_simulation_alleles(all_candidates, all_voters, initial_status, profile, rand, streams,
-                                                  tie_breaking_rule, utility)
-            all_profiles_measurements.append(measurements)
-    return all_profiles_measurements
+    # print(n_candidates, n_voters, assigned_seed, all_voters, flush=True)
+    streams = {'log': log, 'out': out}
+    return run_simulation_alleles(all_candidates, all_voters, initial_status, profile, rand, streams,
+                                  tie_breaking_rule, utility, lockstep, keep_scenarios, detect_cycles,
+                                  exact_max_states, max_alleles, adaptive)
 
 
 def run_simulation_alleles(all_candidates, all_voters, initial_status, profile, rand, streams, tie_breaking_rule,
-                           utility):
-    alleles = []  # Alleles are scenarios
-    for run in range(50):
-        scenario = run_simulation(all_candidates, all_voters, initial_status, tie_breaking_rule, rand,
-                                  **streams)
-        alleles.append(scenario)
-    measurements = aggregate_alleles(alleles, all_voters, profile, utility, tie_breaking_rule)
+                           utility, lockstep=False, keep_scenarios=False, detect_cycles=False, exact_max_states=0,
+                           max_alleles=50, adaptive: tuple = None):
+    """
+    :param exact_max_states: if not 0, compute the exact outcomes (see exact.py) instead of running alleles, unless
+        more states than that are reachable
+    :param max_alleles: number of alleles, or the most of them in adaptive mode
+    :param adaptive: (min alleles, batch size, tolerance) to run alleles in batches, and stop once the estimates of the
+        measures moved by at most tolerance over the last batch (see estimates_stable()). Sequential engine only,
+        without keep_scenarios.
+    """
+    # Computed once per profile and shared by all of its alleles
+    with TIMERS.phase('aggregation'):
+        # compact mode, if voters carry their rank arrays
+        ranks = [voter.ranks for voter in all_voters] if all_voters[0].ranks is not None else None
+        condorcet = condorcet_winners(profile, ranks=ranks)
+    if exact_max_states:
+        with TIMERS.phase('dynamics'):
+            outcomes = run_simulation_exact(all_candidates, all_voters, initial_status, tie_breaking_rule,
+                                            exact_max_states)
+        out = streams['out']
+        out.write(f'{initial_status}\tInitial state\n')
+        if outcomes is not None:
+            for initial_toppers, final_toppers, converged, steps, probability in outcomes:
+                out.write(f'Exact: {final_toppers} {"converged" if converged else "not converged"} with a probability '
+                          f'of {probability}, in {steps} steps on average\n')
+            out.flush()
+            TIMERS.count('exact_profiles')
+            with TIMERS.phase('aggregation'):
+                accumulator = AllelesAccumulator(all_voters, profile, utility, tie_breaking_rule, condorcet)
+                for initial_toppers, final_toppers, converged, steps, probability in outcomes:
+                    accumulator.add(initial_toppers, final_toppers, converged, steps, weight=probability)
+                measurements = accumulator.measurements()
+            measurements.n_alleles = 0
+            return measurements
+        out.write(f'Exact: more than {exact_max_states} states, running alleles instead\n')
+        out.flush()
+        TIMERS.count('exact_fallbacks')
+    if lockstep:
+        with TIMERS.phase('dynamics'):
+            outcomes = run_simulation_lockstep(all_candidates, all_voters, initial_status, tie_breaking_rule, rand,
+                                               max_alleles, TIMERS)
+        out = streams['out']
+        out.write(f'{initial_status}\tInitial state\n')
+        out.write(f'Lockstep: {sum(1 for outcome in outcomes if outcome[2])} of {len(outcomes)} alleles converged\n')
+        out.flush()
+        with TIMERS.phase('aggregation'):
+            measurements = aggregate_outcomes(outcomes, all_voters, profile, utility, tie_breaking_rule, condorcet)
+        measurements.n_alleles = len(outcomes)
+        TIMERS.count('alleles', measurements.n_alleles)
+        return measurements
+    if keep_scenarios:
+        alleles = []  # Alleles are scenarios
+        alleles_cycles = []  # (entry step, length) of the cycle of every allele, None if it had none
+        for run in range(max_alleles):
+            cycles = [] if detect_cycles else None
+            with TIMERS.phase('dynamics'):
+                scenario = run_simulation(all_candidates, all_voters, initial_status, tie_breaking_rule, rand,
+                                          cycles=cycles, **streams)
+            alleles.append(scenario)
+            alleles_cycles.append(cycles[0] if cycles else None)
+        with TIMERS.phase('aggregation'):
+            measurements = aggregate_alleles(alleles, all_voters, profile, utility, tie_breaking_rule, condorcet,
+                                             alleles_cycles)
+    else:
+        # Each allele is summarized as soon as it finishes, and its trajectory is never stored
+        accumulator = AllelesAccumulator(all_voters, profile, utility, tie_breaking_rule, condorcet)
+        batch_size = adaptive[1] if adaptive else max_alleles
+        n_alleles = 0
+        previous_estimates = None
+        while n_alleles < max_alleles:
+            for run in range(min(batch_size, max_alleles - n_alleles)):
+                cycles = [] if detect_cycles else None
+                with TIMERS.phase('dynamics'):
+                    scenario = run_simulation(all_candidates, all_voters, initial_status, tie_breaking_rule, rand,
+                                              trajectory=False, cycles=cycles, **streams)
+                with TIMERS.phase('aggregation'):
+                    accumulator.add_scenario(scenario, cycles[0] if cycles else None)
+                n_alleles += 1
+            if adaptive:
+                estimates = accumulator.estimates()
+                if n_alleles >= adaptive[0] and previous_estimates is not None and \
+                        estimates_stable(previous_estimates, estimates, adaptive[2]):
+                    break
+                previous_estimates = estimates
+        with TIMERS.phase('aggregation'):
+            measurements = accumulator.measurements()
+    TIMERS.count('alleles', measurements.n_alleles)
     # log.write("-------measurements\n")
     # log.write(str(measurements)+'\n')
     # log.write("-------\n")
@@ -431,9 +1487,14 @@ def run_simulation_alleles(all_candidates, all_voters, initial_status, profile,
 
 
 def run_simulation(all_candidates: list, all_voters: list, current_status: Status, tie_breaking_rule: TieBreakingRule,
-                   rand: Random, **streams) -> list:
+                   rand: Random, trajectory=True, cycles: list = None, **streams) -> list:
     """
 
+    :param trajectory: keep every step in the returned scenario list. If False, a ScenarioSummary is returned
+        instead, holding only the initial and final states.
+    :param cycles: if given, states (ranking, ballots and abstaining voters) are remembered after every ballot move.
+        On the first state seen twice, the scenario stops as not converged, and the (entry step, length) of the cycle
+        is appended to this list. Steps count the voters asked.
     :param tie_breaking_rule:
     :param current_status:
     :param all_voters:
@@ -443,28 +1504,36 @@ def run_simulation(all_candidates: list, all_voters: list, current_status: Statu
     """
     # log = streams['log']
     out = streams['out']
-    scenario = []
-    # only increase
-    abstaining_voters_indices = []
+    scenario = [] if trajectory else ScenarioSummary()
+    active_voters = ActiveVoters(all_voters)
     # now for the initial status
     out.write(f'{current_status}\tInitial state\n')
     out.flush()
     scenario.append(current_status.copy())
     step = 0
     max_steps = len(all_voters) * len(all_candidates)
+    visited = dict()  # state -> step it was first seen at
+    moved = True
     while step < max_steps:
-        # recalculated every step, always decrease
-        active_voters_indices = list(itertools.filterfalse(lambda i: i in abstaining_voters_indices,
-                                                           range(len(all_voters))))
+        if cycles is not None and moved:
+            state = (tuple(current_status.ranking()), tuple(voter.most_recent_vote for voter in all_voters),
+                     active_voters.abstaining_indices())
+            entry_step = visited.setdefault(state, step)
+            if entry_step != step:
+                cycles.append((entry_step, step - entry_step))
+                out.write(f'Cycle of {step - entry_step} steps, entered at step {entry_step}\n')
+                TIMERS.count('steps', step)
+                return simulation_not_converged(current_status, scenario, **streams)
+        # updated every step, for the voters whose state could have changed
         n_toppers = len(current_status.toppers)
         if n_toppers < 2:
-            active_voters_indices = list(
-                filter(lambda i: all_voters[i].most_recent_vote != current_status.toppers[0], active_voters_indices))
+            satisfied = {current_status.toppers[0]}
         else:
             # This condition needs to be double checked for all corner cases
-            active_voters_indices = list(
-                filter(lambda i: tie_breaking_rule.winning_probability(
-                    current_status.toppers, all_voters[i].most_recent_vote) < (1 / n_toppers), active_voters_indices))
+            satisfied = {candidate for candidate, probability in
+                         tie_breaking_rule.winning_distribution(current_status.toppers)
+                         if probability >= (1 / n_toppers)}
+        active_voters_indices = active_voters.refresh(satisfied)
 
         status_changed = None
         # Select one voter randomly from Current active_voters_indices list
@@ -473,6 +1542,7 @@ def run_simulation(all_candidates: list, all_voters: list, current_status: Statu
             # pick a voter from ACTIVE voters
             index = rand.choice(active_voters_indices)
             voter = all_voters[index]
+            previous_vote = voter.most_recent_vote
             # ask him to vote
             response = voter.vote(current_status, tie_breaking_rule)
             scenario.append(response)
@@ -482,33 +1552,36 @@ def run_simulation(all_candidates: list, all_voters: list, current_status: Statu
             # evaluate the status
             if response.to is None:
                 # couldn't enhance
-                active_voters_indices.remove(index)
-                if isinstance(voter, LazyVoter):
-                    abstaining_voters_indices.append(index)
+                abstain = isinstance(voter, LazyVoter)
+                active_voters.fail(index, abstain)
+                if abstain:
                     out.write('\tAbstain\n')
 
                 if active_voters_indices:
                     out.write('\n')
                 else:
+                    TIMERS.count('steps', step)
                     return simulation_converged(current_status, scenario, **streams)
             # elif response.frm == response.to:
             #     # voter was satisfied (currently a dead case)
             #     out.write('\n')
             else:
                 out.write("<-- enhancement\n")
-                # update ballot counts
-                current_status.votes[response.frm] -= 1
-                current_status.votes[response.to] += 1
-                # then reorder candidates
-                current_status.in_order()
-
-                scenario.append(current_status.copy())
+                # update ballot counts (and the toppers / runner ups with them)
+                current_status.move(response.frm, response.to)
+                active_voters.voted(index, previous_vote)
+                # A satisfied voter answers with its current ballot: the state did not change
+                moved = response.frm != response.to
+
+                # A summary only needs to count this entry
+                scenario.append(current_status.copy() if trajectory else None)
                 status_changed = True
                 break
 
         # if there were NO active voters (corner case, everyone is already satisfied with the same single candidate)
         if status_changed is None:
             # print('Corner case', len(all_candidates), len(all_voters), flush=True)
+            TIMERS.count('steps', step)
             return simulation_converged(current_status, scenario, write_converged=False, **streams)
 
         # Now we know we entered and exited the inner loop and are sure the active voters list was not exhausted
@@ -518,55 +1591,35 @@ def run_simulation(all_candidates: list, all_voters: list, current_status: Statu
             continue  # No actual need for the keyword 'continue' here. It is just a place holder like 'pass'
         else:
             # we gracefully exited the inner loop because max steps was exhausted
+            TIMERS.count('steps', step)
             return simulation_not_converged(current_status, scenario, **streams)
     else:
         # we gracefully exited the outer loop because max steps was exhausted
+        TIMERS.count('steps', step)
         return simulation_not_converged(current_status, scenario, **streams)
 
 
-def sort_measurements(all_previously_run: dict):
-    temp = all_previously_run.popitem()
-    seed, sample_measurements_arr = temp[0], temp[1]
-    all_previously_run[seed] = sample_measurements_arr
-    n_candidates_range = sorted({msrmnt.n_candidates for msrmnt in sample_measurements_arr})
-    n_voters_range = sorted({msrmnt.n_voters for msrmnt in sample_measurements_arr})
-    # print(n_candidates_range)
-    # print(n_voters_range, flush=True)
-    all_measurements_by_candidates = dict()
-    all_measurements_by_voters = dict()
-    for n_candidates in n_candidates_range:
-        all_measurements_by_candidates[n_candidates] = dict()
-        for n_voters in n_voters_range:
-            if n_voters < n_candidates:
-                continue
-            msrmnt_arr = [msrmnt
-                          for sample_measurements_arr in all_previously_run.values()
-                          for msrmnt in sample_measurements_arr
-                          if msrmnt.n_candidates == n_candidates and msrmnt.n_voters == n_voters]
-            # measurements_summary = MeasurementsSummary.from_iterable(msrmnt_arr, n_candidates, n_voters)
-            all_measurements_by_candidates[n_candidates][n_voters] = msrmnt_arr
-            all_measurements_by_voters.setdefault(n_voters, dict())[n_candidates] = msrmnt_arr
-    return all_measurements_by_candidates, all_measurements_by_voters
-
-
-def generate_graphs(all_measurements_by_candidates: dict, all_measurements_by_voters: dict, target_measurements: list,
-                    out_dir: str):
-    generate_graphs_one_side(all_measurements_by_candidates, target_measurements, 'Candidates', 'Voters', 'o-', out_dir)
-    generate_graphs_one_side(all_measurements_by_voters, target_measurements, 'Voters', 'Candidates', '^-', out_dir)
-
-
-def generate_graphs_one_side(all_measurements_by_candidates, target_measurements, y_label: str, x_label: str,
-                             mark: str, out_dir: str = './') -> None:
+def generate_graphs(all_previously_run: MeasurementStore, target_measurements: list, out_dir: str):
+    generate_graphs_one_side(all_previously_run, all_previously_run.by_candidates(), target_measurements,
+                             'Candidates', 'Voters', 'o-', out_dir)
+    generate_graphs_one_side(all_previously_run, all_previously_run.by_voters(), target_measurements,
+                             'Voters', 'Candidates', '^-', out_dir)
+
+
+def generate_graphs_one_side(all_previously_run: MeasurementStore, cells_by_level: dict, target_measurements: list,
+                             y_label: str, x_label: str, mark: str, out_dir: str = './') -> None:
+    """
+    :param cells_by_level: {n_level1: {n_level2: cell}}, see MeasurementStore.by_candidates() and by_voters()
+    """
+    import matplotlib.pyplot as plt
     for attr_name, len_attr in target_measurements:
         plt.figure()
 
-        for level1_dict in all_measurements_by_candidates.items():
+        for level1_dict in cells_by_level.items():
             n_level1, level2_dict = level1_dict[0], level1_dict[1]
             lst = []
-            for n_level2, measurements_lst in level2_dict.items():
-                attr_summary = np.average([
-                    len(operator.attrgetter(attr_name)(msrmnt)) if len_attr else operator.attrgetter(attr_name)(msrmnt)
-                    for msrmnt in measurements_lst])
+            for n_level2, cell in level2_dict.items():
+                attr_summary = np.average(all_previously_run.column(cell, attr_name))
                 lst.append((n_level2, attr_summary))
             print(n_level1, lst)
             separate_x_y = list(zip(*lst))
@@ -582,7 +1635,7 @@ def generate_graphs_one_side(all_measurements_by_candidates, target_measurements
         plt.xlabel(x_label)
 
         filename = f'{out_dir}/{attr_name} different {y_label}.png'
-        plt.savefig(filename, trnsparent=True)
+        plt.savefig(filename, transparent=True)
         # plt.show(block=False)
 
 
@@ -630,12 +1683,12 @@ def generate_candidates(n_candidates: int, exhaustive: bool, rand: Random, termi
         offset = 1 if terminal_gap else 0
         delta = 2 if inter_gaps else 1
         for i in range(n_candidates):
-            c: Candidate = Candidate(chr(b'A'[0] + i), offset + (i * delta))
+            c: Candidate = Candidate(chr(b'A'[0] + i), offset + (i * delta), i)
             all_candidates.append(c)
     else:
         for i in range(n_candidates):
             # c: Candidate = Candidate(chr(b'A'[0] + i), i+1)
-            c: Candidate = Candidate(chr(b'A'[0] + i), rand.random())
+            c: Candidate = Candidate(chr(b'A'[0] + i), rand.random(), i)
             all_candidates.append(c)
     return all_candidates
 
@@ -0,0 +1,139 @@
+from ntu.votes.tiebreaking import *
+from ntu.votes.voter import *
+
+__doc__ = """
+Exact engine: instead of sampling alleles (random voter orders), follow the probability of every reachable state of
+the best response dynamics of one profile, under the uniform random choice of the next active voter.
+
+A state is what the next steps of engine.run_simulation() depend on: the ranking of the candidates (its order breaks
+ties between the toppers), the voters' ballots, the abstaining voters and the voters still active. The possible moves
+of every state are computed once. The probability of every state is then pushed forward one step (one voter asked)
+at a time, up to the maximum number of steps of engine.run_simulation(), which gives the exact probability of every
+final state, and the expected number of steps to reach it.
+
+Differences from engine.run_simulation():
+ - Like the lockstep engine, the dynamics start from the given initial status and the voters' current ballots. (The
+   sequential engine carries the final status and ballots of one allele over to the next one.)
+ - Cycles are not detected: a cycling run goes on till the maximum number of steps, as without --detect-cycles.
+ - Nothing is written to the out stream but the final states and their probabilities.
+"""
+
+
+def run_simulation_exact(all_candidates: list, all_voters: list, initial_status: Status,
+                         tie_breaking_rule: TieBreakingRule, max_states: int = 20_000) -> list:
+    """The exact outcomes of the best response dynamics of a profile.
+
+    :param all_candidates: candidates, each one with its (dense) index
+    :param all_voters: voters, after building their profiles. Their ballots are restored before returning.
+    :param initial_status: the status the dynamics start from. It is not modified.
+    :param tie_breaking_rule: a fixed priority (e.g. lexicographic) or a random rule
+    :param max_states: give up once more states than that are reachable
+    :return: one (initial toppers, final toppers, converged, expected steps, probability) tuple per distinct outcome,
+        steps as engine.aggregate_outcomes() counts them. None if there are more than max_states states.
+    """
+    max_steps = len(all_voters) * len(all_candidates)
+    lazy = [isinstance(voter, LazyVoter) for voter in all_voters]
+    saved = [(voter.most_recent_vote, getattr(voter, 'abstain', None)) for voter in all_voters]
+
+    nodes = dict()  # key -> (status, ballots, abstaining, active)
+    transitions = dict()  # key -> [(probability, next key, ballot moved), ...]
+
+    def node(status: Status, ballots: tuple, abstaining: tuple, active: tuple):
+        key = (tuple(status.ranking()), ballots, abstaining, active)
+        if key not in nodes:
+            nodes[key] = (status, ballots, abstaining, active)
+        return key
+
+    def refresh(status: Status, ballots: tuple, abstaining: tuple) -> tuple:
+        """The active voters, as engine.ActiveVoters.refresh() finds them after a status change"""
+        n_toppers = len(status.toppers)
+        if n_toppers < 2:
+            satisfied = {status.toppers[0]}
+        else:
+            satisfied = {candidate for candidate, probability in
+                         tie_breaking_rule.winning_distribution(status.toppers) if probability >= (1 / n_toppers)}
+        return tuple(i for i, ballot in enumerate(ballots) if not abstaining[i] and ballot not in satisfied)
+
+    def expand(key) -> list:
+        status, ballots, abstaining, active = nodes[key]
+        moves = []
+        for j, voter in enumerate(all_voters):
+            voter.most_recent_vote = ballots[j]
+            if lazy[j]:
+                voter.abstain = abstaining[j]
+        for i in active:
+            voter = all_voters[i]
+            response = voter.vote(status, tie_breaking_rule)
+            # only the voter asked changes, if at all: restore it for the next one
+            next_vote = voter.most_recent_vote
+            voter.most_recent_vote = ballots[i]
+            if lazy[i]:
+                voter.abstain = abstaining[i]
+            if response.to is None:
+                # couldn't enhance: inactive till the next status change, or for good if it abstains
+                next_abstaining = abstaining[:i] + (True,) + abstaining[i + 1:] if lazy[i] else abstaining
+                next_key = node(status, ballots, next_abstaining, tuple(j for j in active if j != i))
+                moves.append((1 / len(active), next_key, False))
+            else:
+                next_status = status.copy()
+                next_status.move(response.frm, response.to)
+                next_ballots = ballots[:i] + (next_vote,) + ballots[i + 1:]
+                next_key = node(next_status, next_ballots, abstaining,
+                                refresh(next_status, next_ballots, abstaining))
+                moves.append((1 / len(active), next_key, True))
+        return moves
+
+    ballots = tuple(voter.most_recent_vote for voter in all_voters)
+    abstaining = tuple(bool(getattr(voter, 'abstain', False)) for voter in all_voters)
+    status = initial_status.copy()
+    start = node(status, ballots, abstaining, refresh(status, ballots, abstaining))
+
+    # (final toppers, converged) -> [probability, probability weighted sum of voters asked plus ballots moved]
+    outcomes = dict()
+
+    def absorb(key, converged: bool, probability: float, weighted_steps: float) -> None:
+        outcome = outcomes.setdefault((tuple(nodes[key][0].toppers), converged), [0.0, 0.0])
+        outcome[0] += probability
+        outcome[1] += weighted_steps
+
+    try:
+        # key -> [probability, probability weighted sum of ballots moved so far], after 'step' voters were asked
+        current = {start: [1.0, 0.0]}
+        if not nodes[start][3]:
+            # Corner case: nobody wants to move
+            absorb(start, True, 1.0, 0.0)
+            current = dict()
+        step = 0
+        while current:
+            step += 1
+            following = dict()
+            for key, (probability, moved) in current.items():
+                if key not in transitions:
+                    transitions[key] = expand(key)
+                    if len(nodes) > max_states:
+                        return None
+                for move_probability, next_key, success in transitions[key]:
+                    next_probability = probability * move_probability
+                    next_moved = moved * move_probability + (next_probability if success else 0.0)
+                    weighted_steps = next_probability * step + next_moved
+                    if success and step >= max_steps:
+                        absorb(next_key, False, next_probability, weighted_steps)
+                    elif not nodes[next_key][3]:
+                        absorb(next_key, True, next_probability, weighted_steps)
+                    elif step >= max_steps:
+                        absorb(next_key, False, next_probability, weighted_steps)
+                    else:
+                        state = following.setdefault(next_key, [0.0, 0.0])
+                        state[0] += next_probability
+                        state[1] += next_moved
+            current = following
+    finally:
+        for voter, (ballot, abstain) in zip(all_voters, saved):
+            voter.most_recent_vote = ballot
+            if abstain is not None:
+                voter.abstain = abstain
+
+    initial_toppers = initial_status.toppers
+    # same quantity the sequential engine derives from the length of the scenario list
+    return [(initial_toppers, list(final_toppers), converged, (weighted_steps / probability + 1) / 2, probability)
+            for (final_toppers, converged), (probability, weighted_steps) in outcomes.items()]
@@ -1,54 +1,256 @@
+import functools
+import math
+import os
 
-def permute_identityless(bin_names: list, n_voters: int, accepts_mirror_symmetry=False, ret: list = list()) -> list:
+import numpy as np
+
+
+
+def permute_identityless(bin_names: list, n_voters: int, accepts_mirror_symmetry=False, ret: list = None) -> list:
     """generate the exhaustive list of deterministic voters positions.
 
     :param bin_names: All available bins (empty or full). Typically they represent candidate names + intermediate gaps.
     :param n_voters:
     :param accepts_mirror_symmetry:
-    :param ret:
+    :param ret: bin sizes of previously generated placements, if any. The new ones are appended to it.
     :return:
     """
-    ret = __permute_bin_sizes(bin_names, len(bin_names), n_voters, 0, [], accepts_mirror_symmetry, ret)
+    if ret is None:
+        ret = list()
+    ret.extend(__permute_bin_sizes(len(bin_names), n_voters, 0, [], accepts_mirror_symmetry))
     # print(ret)
-    positions = []
-    for line in ret:
-        # remember that sum of line = n_voters
-        i = 0
-        positions_permutation = []
-        for bin in line:
-            for voter in range(bin):
-                positions_permutation.append(bin_names[i])
-            i += 1
-        positions.append(positions_permutation)
-    return positions
+    return [__positions(bin_names, line) for line in ret]
+
+
+def generate_identityless(bin_names: list, n_voters: int, accepts_mirror_symmetry=False):
+    """Lazy version of permute_identityless(): yield the deterministic voters positions one by one, in the same order.
+
+    :param bin_names: All available bins (empty or full). Typically they represent candidate names + intermediate gaps.
+    :param n_voters:
+    :param accepts_mirror_symmetry: if False, a placement and its mirror image are yielded once
+    :return: generator of the positions of all voters, one bin name per voter
+    """
+    for line in __permute_bin_sizes(len(bin_names), n_voters, 0, [], accepts_mirror_symmetry):
+        yield __positions(bin_names, line)
+
+
+def generate_identityless_bin_sizes(n_bins: int, n_voters: int, accepts_mirror_symmetry=False):
+    """Same as generate_identityless(), but yield the number of voters in every bin (a tuple) instead of positions"""
+    yield from __permute_bin_sizes(n_bins, n_voters, 0, [], accepts_mirror_symmetry)
 
 
-def __permute_bin_sizes(alphabet: list, n_pins: int, n_voters: int, level_index: int, partial_result: list = None,
-                        accepts_mirror_symmetry=False, ret: list = None) -> list:
-    # print(level_index, ret)
+def __positions(bin_names: list, line: tuple) -> list:
+    # remember that sum of line = n_voters
+    positions_permutation = []
+    for bin_name, bin_size in zip(bin_names, line):
+        positions_permutation.extend([bin_name] * bin_size)
+    return positions_permutation
+
+
+def __permute_bin_sizes(n_pins: int, n_voters: int, level_index: int, partial_result: list,
+                        accepts_mirror_symmetry=False):
+    """Yield the bin sizes of all placements, in lexicographic order.
+
+    Out of a placement and its mirror image, only the one met first is yielded: the one whose bin sizes are
+    lexicographically not after their reverse. This is decided on the placement itself, without looking back.
+    :param level_index: the bin to fill next
+    :param partial_result: sizes of the bins before level_index. n_voters is what remains for the others.
+    """
     if level_index >= n_pins:
         # Control mirror images
-        if not accepts_mirror_symmetry:
-            if tuple(reversed(partial_result)) in ret:
-                return ret
-        ret.append(tuple(partial_result))
-        return ret
+        if accepts_mirror_symmetry or partial_result <= partial_result[::-1]:
+            yield tuple(partial_result)
+        return
 
-    reminder = n_voters - sum(partial_result[:level_index])
-    for level_val in range(reminder+1):
+    # last level can have only one value
+    first_val = n_voters if level_index == n_pins - 1 else 0
+    for level_val in range(first_val, n_voters + 1):
 
-        # control mirror images
+        # control mirror images (a single bin is its own mirror image)
         if not accepts_mirror_symmetry:
-            if level_index == 0 and level_val > n_voters / 2:
-                return ret
+            if level_index == 0 and level_val > n_voters / 2 and n_pins > 1:
+                return
 
-        # last level can have only one value
-        if level_index == n_pins - 1 and level_val != reminder:
-            continue
         partial_result.append(level_val)
-        __permute_bin_sizes(alphabet, n_pins, n_voters, level_index + 1, partial_result, accepts_mirror_symmetry, ret)
+        yield from __permute_bin_sizes(n_pins, n_voters - level_val, level_index + 1, partial_result,
+                                       accepts_mirror_symmetry)
         partial_result.pop()
-    return ret
+
+
+@functools.lru_cache(maxsize=None)
+def count_identityless(n_bins: int, n_voters: int, accepts_mirror_symmetry=False) -> int:
+    """Number of placements permute_identityless() generates, without generating them.
+
+    :param n_bins: number of available bins (empty or full)
+    :param n_voters:
+    :param accepts_mirror_symmetry: if False, a placement and its mirror image count once
+    :return: the number of placements
+    """
+    return __count_bin_sizes([], n_bins, n_voters, accepts_mirror_symmetry)
+
+
+def unrank_identityless(bin_names: list, n_voters: int, index: int, accepts_mirror_symmetry=False) -> list:
+    """The placement at position 'index' of the list generated by permute_identityless(), without generating the list.
+
+    A placement is kept (out of it and its mirror image) iff its bin sizes are lexicographically not after the
+    reversed bin sizes, which is the placement permute_identityless() meets first.
+    :param bin_names: All available bins (empty or full). Typically they represent candidate names + intermediate gaps.
+    :param n_voters:
+    :param index: 0 <= index < count_identityless(len(bin_names), n_voters, accepts_mirror_symmetry)
+    :param accepts_mirror_symmetry: if False, a placement and its mirror image count once
+    :return: positions of all voters, one bin name per voter
+    """
+    n_bins = len(bin_names)
+    if not 0 <= index < count_identityless(n_bins, n_voters, accepts_mirror_symmetry):
+        raise IndexError(f'No placement {index} of {n_voters} voters in {n_bins} bins')
+    bin_sizes = []
+    for level_index in range(n_bins):
+        reminder = n_voters - sum(bin_sizes)
+        for level_val in range(reminder + 1):
+            if level_index == n_bins - 1:
+                level_val = reminder  # last level can have only one value
+            count = __count_bin_sizes(bin_sizes + [level_val], n_bins, n_voters, accepts_mirror_symmetry)
+            if index < count:
+                bin_sizes.append(level_val)
+                break
+            index -= count
+    positions = []
+    for bin_name, bin_size in zip(bin_names, bin_sizes):
+        positions.extend([bin_name] * bin_size)
+    return positions
+
+
+class EnumerationCache:
+    """Bin sizes of all the placements of permute_identityless(), kept as one array per (bins, voters, mirror flag).
+
+    Each seed needs a single placement, which is unranked on demand. An enumeration is materialized only once it was
+    asked for as many placements as it holds, when listing them all costs no more than unranking them one by one.
+    Every later seed of the run then looks its placement up by index in the shared array. With a folder, arrays are
+    also saved there (one .npy file each), and loaded (memory mapped) by later runs from their first lookup.
+    Enumerations longer than max_placements are never materialized.
+    """
+
+    def __init__(self, folder: str = None, max_placements: int = 1_000_000):
+        """
+        :param folder: where to save and look for enumerations, None to keep them in memory only
+        :param max_placements: longest enumeration to keep
+        """
+        self.folder = folder
+        self.max_placements = max_placements
+        self.enumerations = dict()
+        self.lookups = dict()  # (bins, voters, mirror flag) -> placements unranked so far
+
+    def bin_sizes(self, n_bins: int, n_voters: int, accepts_mirror_symmetry=False):
+        """All the placements, as rows of bin sizes, or None if there are more than max_placements of them"""
+        key = (n_bins, n_voters, bool(accepts_mirror_symmetry))
+        if key not in self.enumerations:
+            self.enumerations[key] = self.__load_or_enumerate(*key)
+        return self.enumerations[key]
+
+    def count(self, n_bins: int, n_voters: int, accepts_mirror_symmetry=False) -> int:
+        """Same as count_identityless()"""
+        return count_identityless(n_bins, n_voters, accepts_mirror_symmetry)
+
+    def placement(self, bin_names: list, n_voters: int, index: int, accepts_mirror_symmetry=False) -> list:
+        """Same as unrank_identityless()"""
+        key = (len(bin_names), n_voters, bool(accepts_mirror_symmetry))
+        if key not in self.enumerations:
+            lookups = self.lookups.get(key, 0)
+            if lookups < self.count(*key) and not (lookups == 0 and self.__saved(*key)):
+                self.lookups[key] = lookups + 1
+                return unrank_identityless(bin_names, n_voters, index, accepts_mirror_symmetry)
+        bin_sizes = self.bin_sizes(*key)
+        if bin_sizes is None:
+            return unrank_identityless(bin_names, n_voters, index, accepts_mirror_symmetry)
+        positions = []
+        for bin_name, bin_size in zip(bin_names, bin_sizes[index].tolist()):
+            positions.extend([bin_name] * bin_size)
+        return positions
+
+    def __path(self, n_bins: int, n_voters: int, accepts_mirror_symmetry: bool) -> str:
+        return os.path.join(self.folder, f'identityless-{n_bins}-{n_voters}-{int(accepts_mirror_symmetry)}.npy')
+
+    def __saved(self, n_bins: int, n_voters: int, accepts_mirror_symmetry: bool) -> bool:
+        """Whether an earlier run saved this enumeration to the folder"""
+        return self.folder is not None and os.path.exists(self.__path(n_bins, n_voters, accepts_mirror_symmetry))
+
+    def __load_or_enumerate(self, n_bins: int, n_voters: int, accepts_mirror_symmetry: bool):
+        n_placements = count_identityless(n_bins, n_voters, accepts_mirror_symmetry)
+        if n_placements > self.max_placements:
+            return None
+        path = None
+        if self.folder is not None:
+            path = self.__path(n_bins, n_voters, accepts_mirror_symmetry)
+            if os.path.exists(path):
+                return np.load(path, mmap_mode='r')
+        bin_sizes = np.empty((n_placements, n_bins), dtype=np.min_scalar_type(n_voters))
+        for i, line in enumerate(generate_identityless_bin_sizes(n_bins, n_voters, accepts_mirror_symmetry)):
+            bin_sizes[i] = line
+        if path is not None:
+            os.makedirs(self.folder, exist_ok=True)
+            # written under a temporary name first, so that other processes never load a partial file
+            temp_path = f'{path}.{os.getpid()}.tmp'
+            with open(temp_path, 'wb') as enumeration_file:
+                np.save(enumeration_file, bin_sizes)
+            os.replace(temp_path, path)
+        return bin_sizes
+
+
+def __count_compositions(total: int, n_parts: int) -> int:
+    """Number of ways to write total as an ordered sum of n_parts non-negative integers"""
+    if n_parts == 0:
+        return 1 if total == 0 else 0
+    return math.comb(total + n_parts - 1, n_parts - 1)
+
+
+def __count_bin_sizes(prefix: list, n_bins: int, n_voters: int, accepts_mirror_symmetry=False) -> int:
+    """Number of placements (bin sizes adding up to n_voters) starting with the given bin sizes.
+
+    Without mirror symmetry, only placements lexicographically not after their reverse are counted. Bins are compared
+    in pairs from outside in (first with last, second with one before last ...). ways_equal[t] counts the ways the
+    free bins of the pairs seen so far take t voters while keeping every pair equal. The placement is decided by the
+    first unequal pair, after which the free bins inside it take the rest of the voters in any way.
+    """
+    n_fixed = len(prefix)
+    free_voters = n_voters - sum(prefix)
+    if free_voters < 0:
+        return 0
+    if accepts_mirror_symmetry:
+        return __count_compositions(free_voters, n_bins - n_fixed)
+
+    total = 0
+    ways_equal = [1] + [0] * free_voters
+    for left in range(n_bins // 2):
+        right = n_bins - 1 - left
+        # free bins strictly between this pair
+        n_free_inside = max(0, right - max(left + 1, n_fixed))
+        # ways_less[u], ways_same[u]: ways this pair is less / equal, its free bins taking u voters
+        ways_less = [0] * (free_voters + 1)
+        ways_same = [0] * (free_voters + 1)
+        if right < n_fixed:
+            ways_less[0] = int(prefix[left] < prefix[right])
+            ways_same[0] = int(prefix[left] == prefix[right])
+        elif left < n_fixed:
+            for u in range(prefix[left] + 1, free_voters + 1):
+                ways_less[u] = 1
+            if prefix[left] <= free_voters:
+                ways_same[prefix[left]] = 1
+        else:
+            for u in range(free_voters + 1):
+                ways_less[u] = (u + 1) // 2
+                ways_same[u] = 1 - u % 2
+        for t, ways in enumerate(ways_equal):
+            if ways:
+                for u in range(free_voters - t + 1):
+                    if ways_less[u]:
+                        total += ways * ways_less[u] * __count_compositions(free_voters - t - u, n_free_inside)
+        ways_equal = [sum(ways_equal[t] * ways_same[u - t] for t in range(u + 1)) for u in range(free_voters + 1)]
+    # all pairs equal: the middle bin (if free) takes the rest
+    middle_is_free = n_bins % 2 and n_bins // 2 >= n_fixed
+    for t, ways in enumerate(ways_equal):
+        if ways and (middle_is_free or t == free_voters):
+            total += ways
+    return total
 
 
 if __name__ == '__main__':
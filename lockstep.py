@@ -0,0 +1,189 @@
+from random import Random
+
+import numpy as np
+
+from ntu.votes.tiebreaking import *
+from ntu.votes.voter import *
+from timers import PhaseTimers
+
+__doc__ = """
+Lockstep engine: run all the alleles (scenarios) of one profile at the same time.
+
+The vote counts of all alleles are rows of one 2-D array, and every loop iteration advances every allele that is still
+running by one step (one voter asked to vote), exactly as one iteration of the inner loop of engine.run_simulation()
+does. Finished alleles are masked out.
+
+Differences from engine.run_simulation():
+ - Every allele starts from the given initial status and the voters' current ballots. (The sequential engine carries
+   the final status and ballots of one allele over to the next one.)
+ - The random voter choices come from a numpy generator seeded from 'rand', so the trajectories are not the same ones
+   the sequential engine draws, only equally likely.
+ - When several best responses give the same utility at the same distance from the voter, the candidate with the
+   smallest index wins (the sequential engine keeps the order of the current ranking).
+ - No trajectory is kept or written; only what aggregate_outcomes() needs.
+ - Status.in_order() and Voter.propose_enhancement() are not called. The best response of every step is counted as
+   one propose_enhancement call in the timers.
+"""
+
+
+def run_simulation_lockstep(all_candidates: list, all_voters: list, initial_status: Status,
+                            tie_breaking_rule: TieBreakingRule, rand: Random, n_alleles: int = 50,
+                            timers: PhaseTimers = None) -> list:
+    """Run n_alleles scenarios of the same profile in lockstep.
+
+    :param all_candidates: candidates, each one with its (dense) index
+    :param all_voters: voters, after building their profiles
+    :param initial_status: the status every allele starts from. It is not modified.
+    :param tie_breaking_rule: a fixed priority (e.g. lexicographic) or a random rule
+    :param rand: the source of randomness of this seed
+    :param n_alleles: number of scenarios
+    :param timers: if given, the steps (voters asked) and best responses of all alleles are counted there
+    :return: one (initial toppers, final toppers, converged, steps) tuple per allele, see engine.aggregate_outcomes()
+    """
+    if isinstance(tie_breaking_rule, FixedPriorityTieBreakingRule):
+        fixed_priority = True
+    elif isinstance(tie_breaking_rule, RandomTieBreakingRule):
+        fixed_priority = False
+    else:
+        raise TypeError("Tie breaking rule not known")
+
+    candidates = sorted(all_candidates, key=lambda candidate: candidate.index)
+    n_candidates = len(candidates)
+    n_voters = len(all_voters)
+    max_steps = n_voters * n_candidates
+    generator = np.random.default_rng(rand.getrandbits(64))
+
+    # ---- constant (per profile) tables
+    scores = np.empty((n_voters, n_candidates))  # scores[v, c] utility of candidate c for voter v
+    distances = np.empty((n_voters, n_candidates))
+    for v, voter in enumerate(all_voters):
+        for candidate in candidates:
+            scores[v, candidate.index] = voter.utility.score(voter.profile, candidate)
+            distances[v, candidate.index] = candidate.distance_to(voter.position)
+    truthful = np.array([voter.get_truthful_vote().index for voter in all_voters])
+    # priority of every candidate (0 is the best)
+    priority = np.empty(n_candidates, dtype=int)
+    if fixed_priority:
+        priority[[candidate.index for candidate in tie_breaking_rule.ordered(candidates)]] = np.arange(n_candidates)
+    lazy = isinstance(all_voters[0], LazyVoter)
+    truthful_voters = isinstance(all_voters[0], TruthfulVoter)
+
+    # ---- state of all alleles
+    initial_counts = np.array([initial_status.freq(candidate) for candidate in candidates])
+    counts = np.tile(initial_counts, (n_alleles, 1))
+    ballots = np.tile([voter.most_recent_vote.index for voter in all_voters], (n_alleles, 1))
+    abstaining = np.tile([bool(getattr(voter, 'abstain', False)) for voter in all_voters], (n_alleles, 1))
+    active = np.zeros((n_alleles, n_voters), dtype=bool)
+    steps = np.zeros(n_alleles, dtype=int)  # number of voters asked
+    successes = np.zeros(n_alleles, dtype=int)  # number of ballots changed
+    running = np.ones(n_alleles, dtype=bool)
+    converged = np.zeros(n_alleles, dtype=bool)
+    needs_refresh = np.ones(n_alleles, dtype=bool)  # at the top of the outer loop of run_simulation()
+
+    def expected_scores(toppers_mask: np.ndarray, voter_scores: np.ndarray) -> np.ndarray:
+        """Expected utility of the voters (last axis of voter_scores) for every toppers set (last axis of mask)"""
+        if fixed_priority:
+            winner = np.argmin(np.where(toppers_mask, priority, n_candidates), axis=-1)
+            return np.take_along_axis(voter_scores, winner[..., None], axis=-1)[..., 0]
+        return (toppers_mask * voter_scores).sum(axis=-1) / toppers_mask.sum(axis=-1)
+
+    def satisfied_mask(rows: np.ndarray) -> np.ndarray:
+        """Candidates whose voters are not active: they win with a probability of at least 1 / len(toppers)"""
+        toppers_mask = counts[rows] == counts[rows].max(axis=1, keepdims=True)
+        if not fixed_priority:
+            return toppers_mask
+        winner = np.argmin(np.where(toppers_mask, priority, n_candidates), axis=1)
+        return np.arange(n_candidates) == winner[:, None]
+
+    while running.any():
+        # ---- top of the outer loop: out of steps, or recalculate the active voters
+        refresh = np.flatnonzero(running & needs_refresh)
+        if refresh.size:
+            exhausted = refresh[steps[refresh] >= max_steps]
+            running[exhausted] = False
+            refresh = refresh[steps[refresh] < max_steps]
+            satisfied = satisfied_mask(refresh)
+            active[refresh] = ~abstaining[refresh] & ~np.take_along_axis(satisfied, ballots[refresh], axis=1)
+            needs_refresh[refresh] = False
+            # Corner case: nobody wants to move
+            nobody = refresh[~active[refresh].any(axis=1)]
+            running[nobody] = False
+            converged[nobody] = True
+
+        rows = np.flatnonzero(running)
+        if not rows.size:
+            break
+
+        # ---- pick one active voter in every running allele
+        n_active = active[rows].sum(axis=1)
+        picks = (generator.random(rows.size) * n_active).astype(int)
+        voters = np.argmax(np.cumsum(active[rows], axis=1) > picks[:, None], axis=1)
+        steps[rows] += 1
+
+        # ---- best response of the picked voters
+        row_counts = counts[rows]
+        frm = ballots[rows, voters]
+        voter_scores = scores[voters]
+        top_score = row_counts.max(axis=1)
+        toppers_mask = row_counts == top_score[:, None]
+        current_utility = expected_scores(toppers_mask, voter_scores)
+        # 'The only case I am fully satisfied': the voter answers with its current ballot
+        fully_satisfied = (toppers_mask.sum(axis=1) == 1) & toppers_mask[np.arange(rows.size), truthful[voters]]
+
+        # hypothetical counts if the voter moves to each candidate: rows x candidates x candidates
+        hypothetical = np.repeat(row_counts[:, None, :], n_candidates, axis=1)
+        hypothetical[np.arange(rows.size), :, frm] -= 1
+        hypothetical[:, np.arange(n_candidates), np.arange(n_candidates)] += 1
+        hypothetical_toppers = hypothetical == hypothetical.max(axis=2, keepdims=True)
+        potential_utility = expected_scores(hypothetical_toppers,
+                                            np.repeat(voter_scores[:, None, :], n_candidates, axis=1))
+
+        # only toppers and runner ups, other than the current ballot, are considered
+        considered = (row_counts >= top_score[:, None] - 1)
+        considered[np.arange(rows.size), frm] = False
+        improving = considered & (potential_utility > current_utility[:, None])
+        best_utility = np.where(improving, potential_utility, -np.inf).max(axis=1)
+        best = improving & (potential_utility == best_utility[:, None])
+        to = np.argmin(np.where(best, distances[voters], np.inf), axis=1)
+        improved = improving.any(axis=1) & ~fully_satisfied
+
+        if truthful_voters:
+            # A truthful voter that can not improve goes back to its truthful vote (without updating its ballot)
+            changed = ~fully_satisfied
+            to = np.where(improved, to, truthful[voters])
+        else:
+            changed = improved
+        to = np.where(fully_satisfied, frm, to)
+
+        # ---- successful steps: update the counts and go back to the top of the outer loop
+        moved = rows[changed | fully_satisfied]
+        moved_frm, moved_to = frm[changed | fully_satisfied], to[changed | fully_satisfied]
+        np.subtract.at(counts, (moved, moved_frm), 1)
+        np.add.at(counts, (moved, moved_to), 1)
+        successes[moved] += 1
+        needs_refresh[moved] = True
+        ballots[rows[improved], voters[improved]] = to[improved]
+
+        # ---- failed steps: the voter is no more active
+        failed = ~(changed | fully_satisfied)
+        failed_rows, failed_voters = rows[failed], voters[failed]
+        active[failed_rows, failed_voters] = False
+        if lazy:
+            abstaining[failed_rows, failed_voters] = True
+        exhausted = failed_rows[~active[failed_rows].any(axis=1)]
+        running[exhausted] = False
+        converged[exhausted] = True
+        running[failed_rows[(steps[failed_rows] >= max_steps) & active[failed_rows].any(axis=1)]] = False
+
+    if timers is not None:
+        timers.count('steps', int(steps.sum()))
+        timers.count('propose_enhancement', int(steps.sum()))
+
+    outcomes = []
+    initial_toppers = initial_status.toppers
+    for allele in range(n_alleles):
+        final_toppers = [candidates[index] for index in np.flatnonzero(counts[allele] == counts[allele].max())]
+        # same quantity the sequential engine derives from the length of the scenario list
+        allele_steps = (steps[allele] + successes[allele] + 1) / 2
+        outcomes.append((initial_toppers, final_toppers, bool(converged[allele]), allele_steps))
+    return outcomes
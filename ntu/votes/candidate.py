@@ -1,13 +1,46 @@
 # from __future__ import annotations
+import weakref
 
 
 class Candidate:
 
-    __doc__ = "One of alternatives to be selected in the voting process"
+    __doc__ = """One of alternatives to be selected in the voting process
 
-    def __init__(self, name='', position=None):
-        self.name = name
-        self.position = position
+    Candidates are immutable and interned: creating a candidate with the same name, position and index as a live one
+    returns that same object. Candidates of one election are therefore compared by identity, and the hash is computed
+    once. Candidates that are not the same object are still equal if they have the same name and position.
+    """
+
+    __slots__ = ('name', 'position', 'index', '_key', '_hash', '__weakref__')
+
+    # (name, position, index) -> the live candidate
+    __interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, name='', position=None, index=None):
+        interned_key = (name, position, index)
+        try:
+            return cls.__interned[interned_key]
+        except KeyError:
+            pass
+        new = super().__new__(cls)
+        object.__setattr__(new, 'name', name)
+        object.__setattr__(new, 'position', position)
+        # dense id of the candidate within its election (0 .. n_candidates - 1), used by compact profiles
+        object.__setattr__(new, 'index', index)
+        object.__setattr__(new, '_key', (name, position))
+        object.__setattr__(new, '_hash', hash((name, position)))
+        cls.__interned[interned_key] = new
+        return new
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"Candidate {self} is immutable")
+
+    def __delattr__(self, key):
+        raise AttributeError(f"Candidate {self} is immutable")
+
+    def __reduce__(self):
+        # unpickled candidates are interned again
+        return self.__class__, (self.name, self.position, self.index)
 
     def __repr__(self):
         return f"{self.name}:{self.position}"
@@ -17,13 +50,13 @@ class Candidate:
             return True
         if other is None:
             return False
-        return (self.position, self.name) == (other.position, other.name)
+        return self._hash == other._hash and self._key == other._key
 
     def __lt__(self, other):
-        return (self.name, self.position).__lt__((other.name, other.position))
+        return self._key < other._key
 
     def __hash__(self):
-        return hash((self.name, self.position))
+        return self._hash
 
     def distance_to(self, other):
         if isinstance(other, Candidate):
@@ -3,8 +3,11 @@ from ntu.votes.candidate import Candidate
 
 
 class TieBreakingRule:
-    @classmethod
-    def get_winner(cls, potential_winners: list) -> Candidate:
+    __doc__ = '''Rules are used through their instances: a subclass may keep its state there (see
+    FixedPriorityTieBreakingRule), so class level calls are not supported in general
+    '''
+
+    def get_winner(self, potential_winners: list) -> Candidate:
         """break a tie between potential winners
 
         :param potential_winners: the list (set ?) of potential winners with a tie
@@ -13,8 +16,7 @@ class TieBreakingRule:
         """
         raise NotImplementedError
 
-    @staticmethod
-    def winning_probability(potential_winners: list, candidate: Candidate):
+    def winning_probability(self, potential_winners: list, candidate: Candidate):
         """Calculate the propability a candidate wins in tie breaking
 
         This function does not throw an exception. If a candidate is NOT in the list, it simply returns 0.
@@ -24,6 +26,15 @@ class TieBreakingRule:
         """
         raise NotImplementedError
 
+    def winning_distribution(self, potential_winners: list) -> list:
+        """Calculate the probabilities of all potential winners at once
+
+        Candidates that can not win may be left out.
+        :param potential_winners: list (set ?) of potential winners with tie
+        :return: list of (candidate, probability) pairs, in the order of potential_winners
+        """
+        return [(candidate, self.winning_probability(potential_winners, candidate)) for candidate in potential_winners]
+
     @staticmethod
     def check_list_length(potential_winners):
         ln = len(potential_winners)
@@ -31,26 +42,49 @@ class TieBreakingRule:
             raise ValueError(f'List is empty')
 
 
-class LexicographicTieBreakingRule(TieBreakingRule):
-    __doc__ = '''Fixed and predefined rule to prefer candidate A to B
+class FixedPriorityTieBreakingRule(TieBreakingRule):
+    __doc__ = '''The candidate found first in a fixed priority order wins
     '''
 
-    # sort_key = operator.attrgetter('name', 'position')
+    def __init__(self, priority: list) -> None:
+        """
+        :param priority: all candidates, the most preferred first
+        """
+        super().__init__()
+        self.priority = {candidate: rank for rank, candidate in enumerate(priority)}
 
-    @classmethod
-    def get_winner(cls, potential_winners: list) -> Candidate:
+    def priority_key(self, candidate: Candidate):
+        """Sort key of a candidate: the smaller, the more preferred"""
+        return self.priority[candidate]
+
+    def ordered(self, candidates: list) -> list:
+        """The candidates, the most preferred first"""
+        return sorted(candidates, key=self.priority_key)
+
+    def get_winner(self, potential_winners: list) -> Candidate:
         TieBreakingRule.check_list_length(potential_winners)
-        sorted_list = sorted(potential_winners)  # , key=LexicographicTieBreakingRule.sort_key)
-        return sorted_list[0]
+        return min(potential_winners, key=self.priority_key)
 
-    @staticmethod
-    def winning_probability(potential_winners: list, candidate: Candidate) -> int:
+    def winning_probability(self, potential_winners: list, candidate: Candidate) -> int:
         if len(potential_winners) == 0:
             return 0
-        try:
-            return 1 if candidate == LexicographicTieBreakingRule.get_winner(potential_winners) else 0
-        except (ValueError, RuntimeError):
-            return 0
+        return 1 if candidate == self.get_winner(potential_winners) else 0
+
+    def winning_distribution(self, potential_winners: list) -> list:
+        return [(self.get_winner(potential_winners), 1)]
+
+
+class LexicographicTieBreakingRule(FixedPriorityTieBreakingRule):
+    __doc__ = '''Fixed and predefined rule to prefer candidate A to B
+    '''
+
+    # sort_key = operator.attrgetter('name', 'position')
+
+    def __init__(self, candidates: list) -> None:
+        """
+        :param candidates: all candidates, in any order: the priority is their natural order (by name, then position)
+        """
+        super().__init__(sorted(candidates))
 
 
 class RandomTieBreakingRule(TieBreakingRule):
@@ -73,6 +107,11 @@ class RandomTieBreakingRule(TieBreakingRule):
         else:
             return 0
 
+    @staticmethod
+    def winning_distribution(potential_winners: list) -> list:
+        probability = 1 / len(potential_winners)
+        return [(candidate, probability) for candidate in potential_winners]
+
 
 if __name__ == '__main__':
     cc = [
@@ -86,7 +125,7 @@ if __name__ == '__main__':
     # print(sorted(cc), key=LexicographicTieBreakingRule.sort_key))
     print(sorted(cc))
 
-    rule = LexicographicTieBreakingRule
+    rule = LexicographicTieBreakingRule(cc)
     winner = rule.get_winner(cc)
     print(winner)
     print(rule.winning_probability(cc, cc[0]))
@@ -94,7 +133,7 @@ if __name__ == '__main__':
     print(rule.winning_probability(cc, Candidate('A', 5)))
 
     # ----------------------
-    rule = RandomTieBreakingRule
+    rule = RandomTieBreakingRule(Random(0))
     winner = rule.get_winner(cc)
     print(winner)
     print(rule.winning_probability(cc, cc[0]))
@@ -9,14 +9,28 @@ class Utility(object):
     def score(self, voter_profile: list, candidate: Candidate) -> int:
         raise NotImplementedError
 
+    def rank_score(self, n_candidates: int, rank: int) -> int:
+        """Score of the candidate found at index 'rank' of a voter profile of 'n_candidates' candidates."""
+        raise NotImplementedError
+
     def __call__(self, voter_profile: list, candidate: Candidate) -> int:
         return self.score(voter_profile, candidate)
 
-    def total_utility(self, user_profile: list, potential_winners: list, tiebreakingrule: TieBreakingRule) -> float:
+    def total_utility(self, user_profile: list, potential_winners: list, tiebreakingrule: TieBreakingRule,
+                      ranks: list = None) -> float:
+        """Expected utility of the user given the potential winners and the tie breaking rule.
+
+        :param ranks: (compact mode) the inverse of user_profile, i.e. ranks[candidate.index] is the index of that
+            candidate in user_profile. If given, scores are looked up instead of searched for.
+        """
         total = 0.0
-        for candidate in potential_winners:
-            total += (self.score(user_profile, candidate)
-                      * tiebreakingrule.winning_probability(potential_winners, candidate))
+        if ranks is None:
+            for candidate, probability in tiebreakingrule.winning_distribution(potential_winners):
+                total += self.score(user_profile, candidate) * probability
+        else:
+            n_candidates = len(ranks)
+            for candidate, probability in tiebreakingrule.winning_distribution(potential_winners):
+                total += self.rank_score(n_candidates, ranks[candidate.index]) * probability
         return total
 
     @classmethod
@@ -33,10 +47,13 @@ class BordaUtility(Utility):
 
     def score(self, voter_profile: list, candidate: Candidate) -> int:
         try:
-            return len(voter_profile) - voter_profile.index(candidate) - 1
+            return self.rank_score(len(voter_profile), voter_profile.index(candidate))
         except ValueError:
             raise ValueError(f"Candidate {candidate} not found")
 
+    def rank_score(self, n_candidates: int, rank: int) -> int:
+        return n_candidates - rank - 1
+
 
 class ExpoUtility(Utility):
 
@@ -56,7 +73,10 @@ class ExpoUtility(Utility):
         if index < 0:
             raise ValueError(f"Candidate {candidate} not found")
         else:
-            return self.base ** (self.exponent_step * (len(voter_profile) - index - 1))
+            return self.rank_score(len(voter_profile), index)
+
+    def rank_score(self, n_candidates: int, rank: int) -> int:
+        return self.base ** (self.exponent_step * (n_candidates - rank - 1))
 
 
 class UtilityTypes(Enum):
@@ -1,4 +1,5 @@
 import operator
+from collections import OrderedDict
 from enum import Enum, auto
 
 from ntu.votes.candidate import Candidate
@@ -12,6 +13,10 @@ Define different types of voters
 There are general voters, lazy voters, and Truthful voters.
 """
 
+# Calls of Status.in_order() and Voter.propose_enhancement(), till the engine reads and resets them. (A module level
+# dict: writing class attributes would invalidate the attribute lookup caches of the class.)
+CALLS = {'in_order': 0, 'propose_enhancement': 0}
+
 
 class UpdateEvent:
     """Immutable class"""
@@ -28,49 +33,180 @@ class Status:
     votes: dict = None  # contains only the candidates which have at least one vote
     toppers: list = None
     runner_ups: list = None
+    # frequency -> candidates having exactly that many votes, kept in ranking order
+    buckets: dict = None
+    top_score: int = None
+    # In compact mode 'votes' is a list of frequencies indexed by Candidate.index instead of a dictionary
+    compact: bool = False
 
     @classmethod
-    def from_profile(cls, profile: list) -> 'Status':
+    def from_profile(cls, profile: list, compact=False) -> 'Status':
         votes = [user_profile[0] for user_profile in profile]
-        return cls.from_votes(votes, profile[0])
+        return cls.from_votes(votes, profile[0], compact)
 
     @classmethod
-    def from_votes(cls, votes: list, all_candidates: list) -> 'Status':
+    def from_votes(cls, votes: list, all_candidates: list, compact=False) -> 'Status':
         new = cls.__new__(Status)
-        new.votes = {candidate: 0 for candidate in all_candidates}  # This 'votes' is a dictionary
-        for candidate in votes:  # This 'votes' is a list.
-            new.votes[candidate] = new.votes[candidate] + 1
+        if compact:
+            new.compact = True
+            new.votes = [0] * len(all_candidates)
+            for candidate in votes:
+                new.votes[candidate.index] += 1
+            # The candidates order (before sorting) cannot be kept in a list of frequencies, so seed it here
+            new.buckets = {0: list(all_candidates)}
+        else:
+            new.votes = {candidate: 0 for candidate in all_candidates}  # This 'votes' is a dictionary
+            for candidate in votes:  # This 'votes' is a list.
+                new.votes[candidate] = new.votes[candidate] + 1
         new.in_order()
         return new
 
+    def freq(self, candidate: Candidate) -> int:
+        """Number of votes of a candidate, in either mode."""
+        return self.votes[candidate.index] if self.compact else self.votes[candidate]
+
     def in_order(self) -> list:
-        """Return the votes as a list of frequencies, and cache the top two groups (toppers and runner ups)."""
-        lst = list(self.votes.items())
+        """Rebuild the frequency buckets from 'votes' and return the votes as a list of frequencies.
+
+        This is the full (sorting) resynchronization. It is only needed after editing 'votes' directly; ballot
+        changes should go through move(), which keeps the buckets up to date incrementally.
+        """
+        CALLS['in_order'] += 1
+        if self.buckets is None:
+            lst = list(self.votes.items())
+        else:
+            lst = [(candidate, self.freq(candidate)) for (candidate, freq) in self.ranking()]
         """If using Python 3.7, dictionary order is guaranteed to be preserved"""
         lst.sort(key=operator.itemgetter(1), reverse=True)
-        self.__cache_top_candidates(lst)
+        self.buckets = dict()
+        for candidate, freq in lst:
+            self.buckets.setdefault(freq, []).append(candidate)
+        self.top_score = lst[0][1]
+        self.__cache_top_candidates()
         return lst
 
-    def __cache_top_candidates(self, ordered: list):
-        top_score = ordered[0][1]
-        self.toppers = [candidate for (candidate, freq) in ordered if freq == top_score]
-        self.runner_ups = [candidate for (candidate, freq) in ordered if freq == top_score - 1]
-        # to make it probably faster later, provided that we are using Python 3.7+ or cpython 3.6
-        self.votes = dict(ordered)
+    def ranking(self) -> list:
+        """Return the votes as a list of frequencies, in the same order in_order() would, without sorting them."""
+        buckets = self.buckets
+        return [(candidate, freq) for freq in sorted(buckets, reverse=True) for candidate in buckets[freq]]
+
+    def move(self, frm: Candidate, to: Candidate):
+        """Move one ballot from 'frm' to 'to' and refresh the toppers and runner ups.
+
+        A candidate that gains a vote joins the end of its new bucket, and a candidate that loses one joins the front,
+        which is exactly where a stable re-sort of the previous ranking would put it.
+        """
+        if frm == to:
+            return
+        votes = self.votes
+        buckets = self.buckets
+        frm_key, to_key = (frm.index, to.index) if self.compact else (frm, to)
+
+        freq = votes[frm_key]
+        bucket = buckets[freq]
+        bucket.remove(frm)
+        if not bucket:
+            del buckets[freq]
+        votes[frm_key] = freq - 1
+        buckets.setdefault(freq - 1, []).insert(0, frm)
+
+        freq = votes[to_key]
+        bucket = buckets[freq]
+        bucket.remove(to)
+        if not bucket:
+            del buckets[freq]
+        votes[to_key] = freq + 1
+        buckets.setdefault(freq + 1, []).append(to)
+
+        if freq + 1 > self.top_score:
+            self.top_score = freq + 1
+        elif self.top_score not in buckets:
+            # 'frm' was the only topper
+            self.top_score -= 1
+        self.__cache_top_candidates()
+
+    def toppers_after_move(self, frm: Candidate, to: Candidate) -> list:
+        """Return the toppers the status would have if one ballot moved from 'frm' to 'to', without moving it."""
+        if frm == to:
+            return self.toppers.copy()
+        top_score = self.top_score
+        frm_freq = self.freq(frm) - 1
+        to_freq = self.freq(to) + 1
+        others_on_top = any(candidate is not frm and candidate is not to for candidate in self.buckets[top_score])
+        new_top_score = max(to_freq, frm_freq, top_score if others_on_top else top_score - 1)
+
+        toppers = [candidate for candidate in self.buckets.get(new_top_score, ())
+                   if candidate is not frm and candidate is not to]
+        if frm_freq == new_top_score:
+            toppers.insert(0, frm)
+        if to_freq == new_top_score:
+            toppers.append(to)
+        return toppers
+
+    def __cache_top_candidates(self):
+        self.toppers = self.buckets[self.top_score].copy()
+        self.runner_ups = self.buckets.get(self.top_score - 1, []).copy()
 
     def copy(self) -> 'Status':
         new = self.__class__.__new__(Status)
+        new.compact = self.compact
         if self.votes:
             new.votes = self.votes.copy()
-        if self.toppers:
+        if self.buckets:
+            new.buckets = {freq: bucket.copy() for freq, bucket in self.buckets.items()}
+            new.top_score = self.top_score
+        if self.toppers is not None:
             new.toppers = self.toppers.copy()
-        if self.runner_ups:
+        if self.runner_ups is not None:
             new.runner_ups = self.runner_ups.copy()
         return new
 
     def __repr__(self):
         # return str([candidate.name[0] for (candidate, freq) in self.votes.items()])
-        return str(list(self.in_order()))
+        return str(self.ranking())
+
+
+class BestResponseMemo:
+    """Bounded LRU table of best responses, shared by voters with identical profiles.
+
+    A best response depends only on the voter profile (for a given utility and tie breaking rule), its current vote and
+    the (ordered) toppers and runner ups, so it is keyed on these. What is kept is the list of the best candidates
+    before the distance tie break, which is the only part that depends on the voter position.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.table = OrderedDict()
+        self.profile_ids = dict()  # profile (tuple) -> small int used in keys
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, voter: 'Voter') -> None:
+        """Let the voter use this memo. Call it after the voter builds its profile."""
+        voter.memo = self
+        voter.memo_profile = self.profile_ids.setdefault(tuple(voter.profile), len(self.profile_ids))
+
+    def get(self, key: tuple):
+        """The best candidates stored under key, or None if they are not (or no more) kept"""
+        best = self.table.get(key)
+        if best is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.table.move_to_end(key)
+        return best
+
+    def put(self, key: tuple, best: tuple) -> None:
+        self.table[key] = best
+        if len(self.table) > self.max_size:
+            self.table.popitem(last=False)
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __repr__(self):
+        return f"{self.hits} hits, {self.misses} misses ({self.hit_rate():.1%}), {len(self.table)} kept"
 
 
 class VoterTypes(Enum):
@@ -83,8 +219,13 @@ class Voter:
 
     position: int = None
     profile: list = None
+    # (compact mode) inverse of the profile: ranks[candidate.index] is the index of that candidate in the profile
+    ranks: list = None
     utility: Utility = None
     most_recent_vote: Candidate = None
+    # optional memo of best responses, see BestResponseMemo.register()
+    memo: BestResponseMemo = None
+    memo_profile: int = None
 
     def __init__(self, position: int, utility: Utility = BordaUtility):
         self.position = position
@@ -94,8 +235,12 @@ class Voter:
         return f"{self.__class__.__name__}({self.position})\t{self.profile}"
 
     # def build_profile(self, candidates: list = None, profile: 'ProfilePreference' = SinglePeakedProfilePreference()):
-    def build_profile(self, candidates: list = None, profile=None):
+    def build_profile(self, candidates: list = None, profile=None, compact=False):
         self.profile = profile.build_profile(self, candidates)
+        if compact:
+            self.ranks = [0] * len(self.profile)
+            for rank, candidate in enumerate(self.profile):
+                self.ranks[candidate.index] = rank
         # Will need that later
         self.most_recent_vote = self.get_truthful_vote()
 
@@ -129,7 +274,7 @@ class Voter:
         :param tie_breaking_rule: the tie breaking rule in effect (lexicographically or random)
         :return:
         """
-        utility = self.utility
+        CALLS['propose_enhancement'] += 1
         frm = self.most_recent_vote
         winners = current_status.toppers
         runner_ups = current_status.runner_ups
@@ -142,8 +287,39 @@ class Voter:
         be the sole winner?"""
         "Update: I am going to include the runner ups list in the same loop:"
         "Let's now try to upgrade one of the runner ups to compete with top list" """(as well)"""
-        current_utility = utility.total_utility(self.profile, winners, tie_breaking_rule)
-        proposed_status = current_status.copy()
+        memo = self.memo
+        if memo is None:
+            best = self.best_responses(current_status, tie_breaking_rule)
+        else:
+            key = (self.memo_profile, frm, tuple(winners), tuple(runner_ups))
+            best = memo.get(key)
+            if best is None:
+                best = self.best_responses(current_status, tie_breaking_rule)
+                memo.put(key, best)
+
+        if len(best) == 0:
+            'I can not improve'
+            return UpdateEvent(self, frm, None)
+        else:
+            # enhance the selection process: select the nearest candidate to me among several alternatives
+            "TODO was the previous line in the requirements?"
+            if len(best) > 1:
+                best = sorted(best, key=lambda candidate: candidate.distance_to(self.position))
+
+            to = best[0]
+            self.most_recent_vote = to
+            return UpdateEvent(self, frm, to)
+
+    def best_responses(self, current_status: Status, tie_breaking_rule: TieBreakingRule) -> tuple:
+        """The candidates (among toppers and runner ups) that would increase my utility the most if I voted for them.
+
+        :return: the best candidates, in the order of the toppers then runner ups. Empty if I can not improve.
+        """
+        utility = self.utility
+        frm = self.most_recent_vote
+        winners = current_status.toppers
+        runner_ups = current_status.runner_ups
+        current_utility = utility.total_utility(self.profile, winners, tie_breaking_rule, self.ranks)
         potential_updates = []
         # for candidate in toppers:
         combined_list = list(winners)
@@ -153,36 +329,20 @@ class Voter:
             if candidate == frm:
                 continue
 
-            proposed_status.votes[frm] = proposed_status.votes[frm] - 1
-            proposed_status.votes[candidate] = proposed_status.votes[candidate] + 1
-            proposed_status.in_order()
-
-            potential_utility = utility.total_utility(self.profile, proposed_status.toppers, tie_breaking_rule)
+            potential_toppers = current_status.toppers_after_move(frm, candidate)
+            potential_utility = utility.total_utility(self.profile, potential_toppers, tie_breaking_rule,
+                                                      self.ranks)
             if potential_utility > current_utility:
                 # potential_updates.append((potential_utility, candidate))
                 potential_updates.append((potential_utility, candidate, current_utility))
 
-            proposed_status.votes[frm] = proposed_status.votes[frm] + 1
-            proposed_status.votes[candidate] = proposed_status.votes[candidate] - 1
-        proposed_status.in_order()
-
         if len(potential_updates) == 0:
-            'I can not improve'
-            return UpdateEvent(self, frm, None)
-        else:
-            potential_updates.sort(key=operator.itemgetter(0), reverse=True)
-
-            # potential_updates = [update for update in potential_updates if update[0] == potential_updates[0][0]]
-            potential_updates = list(filter(lambda update: update[0] == potential_updates[0][0], potential_updates))
-            # print(potential_updates)
-            # enhance the selection process: select the nearest candidate to me among several alternatives
-            "TODO was the previous line in the requirements?"
-            if len(potential_updates) > 1:
-                potential_updates.sort(key=lambda update: (update[1]).distance_to(self.position))
-
-            to = potential_updates[0][1]
-            self.most_recent_vote = to
-            return UpdateEvent(self, frm, to)
+            return ()
+        potential_updates.sort(key=operator.itemgetter(0), reverse=True)
+        # potential_updates = [update for update in potential_updates if update[0] == potential_updates[0][0]]
+        potential_updates = list(filter(lambda update: update[0] == potential_updates[0][0], potential_updates))
+        # print(potential_updates)
+        return tuple(update[1] for update in potential_updates)
 
     def vote(self, current_state: Status, tie_breaking_rule: TieBreakingRule = None) -> UpdateEvent:
         if self.profile is None:
@@ -0,0 +1,35 @@
+import os
+
+from docopt import docopt
+from engine import TARGET_MEASUREMENTS, generate_graphs, load_results
+
+
+def main():
+    doc = """Plot the graphs of a run of engine.py from its saved results
+
+Usage:
+  plot.py [options] <RFILE>
+
+
+Options:
+  -o, --out-folder=OFOLDER      Output folder where the graphs are written      [Default: ./out]
+  --show                        Show the graphs
+  -h, --help                    Print the help screen
+  RFILE                         Results file written by engine.py --results, or
+                                its --checkpoint file
+
+
+"""
+
+    args = docopt(doc)
+    all_previously_run = load_results(args['<RFILE>'])
+    os.makedirs(args['--out-folder'], exist_ok=True)
+    generate_graphs(all_previously_run, TARGET_MEASUREMENTS, args['--out-folder'])
+    if bool(args['--show']):
+        import matplotlib.pyplot as plt
+        plt.show()
+
+
+# --------------------------
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import itertools
+from random import Random
+
+import pytest
+
+from engine import ActiveVoters, generate_candidates
+from ntu.votes.tiebreaking import LexicographicTieBreakingRule, RandomTieBreakingRule
+
+
+class Ballot:
+    """Stands in for a voter: ActiveVoters only reads its most recent vote"""
+
+    def __init__(self, most_recent_vote):
+        self.most_recent_vote = most_recent_vote
+
+
+def filtered_active_voters(all_voters: list, abstaining: list, toppers: list, tie_breaking_rule) -> list:
+    """The active voters as run_simulation() recalculated them every step, before ActiveVoters"""
+    active_voters_indices = list(itertools.filterfalse(lambda i: i in abstaining, range(len(all_voters))))
+    n_toppers = len(toppers)
+    if n_toppers < 2:
+        return list(filter(lambda i: all_voters[i].most_recent_vote != toppers[0], active_voters_indices))
+    return list(filter(lambda i: tie_breaking_rule.winning_probability(toppers, all_voters[i].most_recent_vote)
+                       < (1 / n_toppers), active_voters_indices))
+
+
+@pytest.mark.parametrize('tie_breaking', ['lexicographic', 'random'])
+def test_active_voters_match_the_filtered_ones(tie_breaking):
+    rand = Random(0)
+    for trial in range(200):
+        candidates = generate_candidates(rand.randint(2, 6), False, rand)
+        rule = LexicographicTieBreakingRule(candidates) if tie_breaking == 'lexicographic' \
+            else RandomTieBreakingRule(rand)
+        all_voters = [Ballot(rand.choice(candidates)) for _ in range(rand.randint(1, 12))]
+        lazy = [rand.random() < 0.3 for _ in all_voters]
+        active_voters = ActiveVoters(all_voters)
+        abstaining = []
+        for step in range(30):
+            toppers = rand.sample(candidates, rand.randint(1, len(candidates)))
+            # as run_simulation() finds them
+            if len(toppers) < 2:
+                satisfied = {toppers[0]}
+            else:
+                satisfied = {candidate for candidate, probability in rule.winning_distribution(toppers)
+                             if probability >= (1 / len(toppers))}
+            expected = filtered_active_voters(all_voters, abstaining, toppers, rule)
+            assert active_voters.refresh(satisfied) == expected
+            while expected:
+                index = rand.choice(expected)
+                if rand.random() < 0.5:
+                    # couldn't enhance
+                    expected.remove(index)
+                    active_voters.fail(index, lazy[index])
+                    if lazy[index]:
+                        abstaining.append(index)
+                    assert active_voters.indices == expected
+                else:
+                    # the ballot moves (or stays, for a satisfied voter), and the status changes
+                    previous_vote = all_voters[index].most_recent_vote
+                    all_voters[index].most_recent_vote = rand.choice(candidates)
+                    active_voters.voted(index, previous_vote)
+                    break
+            assert list(active_voters.abstaining_indices()) == sorted(abstaining)
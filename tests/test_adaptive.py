@@ -0,0 +1,59 @@
+import io
+import sys
+
+import pytest
+
+import engine
+
+ARGS = {'--cmin': '3', '--cmax': '4', '--vmin': 'cmin', '--vmax': '6', '--random-search': True, '--utility': 'borda',
+        '--preference': 'general', '--tiebreakingrule': 'random', '--voters': 'general', '<BASE>': None,
+        '<EXPO_STEP>': None, '--max-alleles': '40'}
+ADAPTIVE = {'--adaptive-alleles': True, '--min-alleles': '10', '--allele-batch': '5'}
+
+
+def simulate(seed: int, **options) -> list:
+    """The measurements of every cell of a seed, each one drawn from its own random stream (as in the cells schedule),
+    so that the alleles of a cell do not depend on how many alleles the cells before it ran"""
+    args = {**ARGS, **options, 'assigned_seed': seed, 'log': io.StringIO(), 'out': io.StringIO()}
+    return [engine.run_cell(args, cell) for cell in engine.grid_cells(args)]
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_adaptive_alleles_stop_at_the_tolerance(monkeypatch, seed):
+    # any change is small enough: every profile stops at the least number of alleles
+    assert [m.n_alleles for m in simulate(seed, **ADAPTIVE, **{'--allele-tolerance': '1000'})] == [10] * 4
+    # no change is small enough: every profile runs the most alleles
+    assert [m.n_alleles for m in simulate(seed, **ADAPTIVE, **{'--allele-tolerance': '-1'})] == [40] * 4
+
+    tests = []  # outcome of every stability test, profile after profile
+    estimates_stable = engine.estimates_stable
+    monkeypatch.setattr(engine, 'estimates_stable', lambda *args: tests.append(estimates_stable(*args)) or tests[-1])
+    adaptive = simulate(seed, **ADAPTIVE, **{'--allele-tolerance': '0.02'})
+    monkeypatch.undo()
+    assert any(measurements.n_alleles < 40 for measurements in adaptive)
+    for measurements in adaptive:
+        n_alleles = measurements.n_alleles
+        assert 10 <= n_alleles <= 40 and not n_alleles % 5
+        # tested after every batch from the least number of alleles on, and stopped at the first stable one
+        n_tests = (n_alleles - 10) // 5 + 1
+        profile_tests, tests = tests[:n_tests], tests[n_tests:]
+        assert not any(profile_tests[:-1])
+        assert profile_tests[-1] or n_alleles == 40
+        # the same alleles as a run of that many alleles: later ones are not drawn
+        cell = (measurements.n_candidates, measurements.n_voters)
+        fixed = simulate(seed, **{'--max-alleles': str(n_alleles)})
+        assert [m.to_bytes() for m in fixed if (m.n_candidates, m.n_voters) == cell] == [measurements.to_bytes()]
+    assert not tests
+
+
+@pytest.mark.parametrize('options', [
+    ['--max-alleles', '0'],
+    ['--adaptive-alleles', '--allele-batch', '0'],
+    ['--adaptive-alleles', '--min-alleles', '0'],
+    ['--adaptive-alleles', '--min-alleles', '20', '--max-alleles', '10'],
+])
+def test_bad_numbers_of_alleles_are_rejected(monkeypatch, tmp_path, options):
+    monkeypatch.setattr(sys, 'argv', ['engine.py', '--comm', 'serial', '--no-graphs', '-o', str(tmp_path / 'out'),
+                                      '-l', str(tmp_path / 'log.txt'), *options])
+    with pytest.raises(TypeError, match='alleles|batch'):
+        engine.main()
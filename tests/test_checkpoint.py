@@ -0,0 +1,104 @@
+import io
+import pickle
+import sys
+
+import numpy as np
+import pytest
+
+import engine
+
+OPTIONS = ['--comm', 'serial', '--no-graphs', '-c', '3', '-v', '4', '-i', '4', '--max-alleles', '10',
+           '--conv-threshold', '0.3']
+
+
+def simulate_cells() -> list:
+    """The measurements of one seed of a small grid"""
+    args = {'--cmin': '3', '--cmax': '4', '--vmin': 'cmin', '--vmax': '6', '--random-search': True,
+            '--utility': 'borda', '--preference': 'single-peaked', '--tiebreakingrule': 'lexicographic',
+            '--voters': 'general', '<BASE>': None, '<EXPO_STEP>': None, 'assigned_seed': 0, 'log': io.StringIO(),
+            'out': io.StringIO()}
+    return engine.run_all_simulations_per_seed(args)
+
+
+class Interrupted(Exception):
+    pass
+
+
+def run_main(monkeypatch, tmp_path, options: list, interrupt_at: int = None, name: str = 'run') -> int:
+    """Run engine.main() with the options, and return the number of rounds it tested for convergence.
+
+    :param interrupt_at: if given, the run is killed in this round, before its checkpoint is saved
+    :param name: the run writes its log to tmp_path / name.log
+    """
+    rounds = []
+    run_converged = engine.run_converged
+
+    def counting_run_converged(*args, **kwargs):
+        rounds.append(None)
+        if len(rounds) == interrupt_at:
+            raise Interrupted()
+        return run_converged(*args, **kwargs)
+
+    monkeypatch.setattr(engine, 'run_converged', counting_run_converged)
+    monkeypatch.setattr(sys, 'argv', ['engine.py', *OPTIONS, '-o', str(tmp_path / 'out'),
+                                      '-l', str(tmp_path / f'{name}.log'), *options])
+    if interrupt_at is None:
+        engine.main()
+    else:
+        with pytest.raises(Interrupted):
+            engine.main()
+    monkeypatch.undo()
+    return len(rounds)
+
+
+def test_resumed_run_stops_at_the_same_round(monkeypatch, tmp_path):
+    options = ['-C', '3', '-V', '4']
+    rounds = run_main(monkeypatch, tmp_path, options)
+    assert rounds > 2
+    checkpoint = str(tmp_path / 'checkpoint.pkl')
+    run_main(monkeypatch, tmp_path, [*options, '--checkpoint', checkpoint], interrupt_at=3)
+    # the checkpoint of round 2 is the last one saved
+    assert 2 + run_main(monkeypatch, tmp_path, [*options, '--checkpoint', checkpoint, '--resume']) == rounds
+
+
+def test_convergence_test_does_not_depend_on_past_rounds():
+    rows = engine.pack_measurements({0: simulate_cells()})['rows']
+    rand = np.random.default_rng(0)
+    store = engine.MeasurementStore()
+    columns = engine.ConvergenceColumns()
+    count = 0
+    for size in (4, 4, 6, 8, 12, 20):
+        new_rows = np.repeat(rows, size)
+        new_rows['seed'] = np.tile(np.arange(count, count + size), len(rows))
+        for attr_name, len_attr in engine.TARGET_MEASUREMENTS:
+            new_rows[attr_name] = rand.integers(0, 4, len(new_rows)) if len_attr else rand.normal(50, 10, len(new_rows))
+        store.append({'rows': new_rows, 'codes': np.zeros(0, dtype=np.uint8), 'positions': np.zeros(0)})
+        for threshold in np.linspace(0.05, 1, 20):
+            # kept from round to round, or built from all the rows as a resumed run does
+            assert engine.run_converged(store, count, engine.TARGET_MEASUREMENTS, threshold, columns) == \
+                engine.run_converged(store, count, engine.TARGET_MEASUREMENTS, threshold)
+        count = len(store)
+
+
+@pytest.mark.parametrize('schedule', ['static', 'cells'])
+def test_resumed_run_gives_the_same_results(monkeypatch, tmp_path, schedule):
+    options = ['--schedule', schedule, '-C', '4', '-V', '6']
+    uninterrupted = str(tmp_path / 'uninterrupted.pkl')
+    rounds = run_main(monkeypatch, tmp_path, [*options, '--results', uninterrupted])
+    assert rounds > 2
+    checkpoint = str(tmp_path / 'checkpoint.pkl')
+    resumed = str(tmp_path / 'resumed.pkl')
+    run_main(monkeypatch, tmp_path, [*options, '--checkpoint', checkpoint], interrupt_at=3)
+    with open(checkpoint, 'rb') as checkpoint_file:
+        saved_costs = pickle.load(checkpoint_file)['cell_costs']
+    assert 2 + run_main(monkeypatch, tmp_path, [*options, '--checkpoint', checkpoint, '--resume', '--results', resumed],
+                        name='resumed') == rounds
+    # the cells schedule runs the units of a round in the order of their measured costs
+    order = ['seed', 'n_candidates', 'n_voters']
+    assert np.sort(engine.load_results(resumed).packed()['rows'], order=order).tobytes() == \
+        np.sort(engine.load_results(uninterrupted).packed()['rows'], order=order).tobytes()
+    if schedule == 'cells':
+        # the costs measured before the interruption schedule the first resumed round
+        assert set(saved_costs) == {(3, 4), (3, 6), (4, 4), (4, 6)}
+        first_round = (tmp_path / 'resumed.log').read_text().split('Timers of the round')[0]
+        assert 'estimated seconds per rank' in first_round
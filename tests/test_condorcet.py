@@ -0,0 +1,29 @@
+from random import Random
+
+from engine import condorcet_winners, generate_candidates, generate_voters, is_condorcet_winner, pairwise_majority
+from ntu.votes.profilepreference import GeneralProfilePreference, SinglePeakedProfilePreference
+from ntu.votes.utility import BordaUtility
+
+
+def test_condorcet_winners_match_is_condorcet_winner():
+    rand = Random(0)
+    kinds = set()
+    for trial in range(600):
+        n_candidates = rand.randint(2, 6)
+        all_candidates = generate_candidates(n_candidates, False, rand)
+        # few voters, often an even number of them: ties and majority cycles are common
+        all_voters = generate_voters(rand.randint(1, 8), 'general', BordaUtility(), rand)
+        preference = GeneralProfilePreference(rand) if trial % 3 else SinglePeakedProfilePreference()
+        compact = bool(trial % 2)
+        for voter in all_voters:
+            voter.build_profile(all_candidates, preference, compact)
+        profile = [voter.getprofile() for voter in all_voters]
+
+        weak = frozenset(candidate for candidate in all_candidates if is_condorcet_winner(profile, candidate))
+        strong = frozenset(candidate for candidate in all_candidates if is_condorcet_winner(profile, candidate, False))
+        ranks = [voter.ranks for voter in all_voters] if compact else None
+        assert condorcet_winners(profile, ranks=ranks) == (weak, strong)
+        assert condorcet_winners(profile, pairwise_majority(profile)) == (weak, strong)
+        kinds.add('no winner' if not weak else 'tied winners' if len(weak) > 1 else
+                  'strong winner' if strong else 'weak winner')
+    assert kinds == {'no winner', 'tied winners', 'strong winner', 'weak winner'}
@@ -0,0 +1,74 @@
+import io
+from random import Random
+
+import pytest
+
+from engine import run_simulation, run_simulation_alleles
+from ntu.votes.candidate import Candidate
+from ntu.votes.profilepreference import SinglePeakedProfilePreference
+from ntu.votes.tiebreaking import LexicographicTieBreakingRule
+from ntu.votes.utility import BordaUtility
+from ntu.votes.voter import Status, TruthfulVoter
+
+
+def build() -> tuple:
+    """Truthful voters whose best responses cycle: a voter that can not improve goes back to its truthful vote, which
+    lets another voter improve again"""
+    all_candidates = [Candidate(name, 2 * index, index) for index, name in enumerate('ABCD')]
+    all_voters = [TruthfulVoter(position, BordaUtility()) for position in (4, 1, 7, 2, 1, 5)]
+    for voter in all_voters:
+        voter.build_profile(all_candidates, SinglePeakedProfilePreference())
+    profile = [voter.getprofile() for voter in all_voters]
+    return all_candidates, all_voters, profile
+
+
+def test_cycle_stops_the_scenario():
+    all_candidates, all_voters, profile = build()
+    rule = LexicographicTieBreakingRule(all_candidates)
+    max_steps = len(all_voters) * len(all_candidates)
+    scenario = run_simulation(all_candidates, all_voters, Status.from_profile(profile), rule, Random(1), log=None,
+                              out=io.StringIO())
+    # without detection, it runs out of steps
+    assert scenario[-1] is False
+    assert sum(1 for entry in scenario[1:-2] if not isinstance(entry, Status)) == max_steps
+
+    all_candidates, all_voters, profile = build()
+    cycles = []
+    out = io.StringIO()
+    detected = run_simulation(all_candidates, all_voters, Status.from_profile(profile), rule, Random(1), cycles=cycles,
+                              log=None, out=out)
+    assert cycles == [(17, 5)]
+    assert 'Cycle of 5 steps, entered at step 17\n' in out.getvalue()
+    assert detected[-1] is False
+    # the same scenario, stopped once it is back to the state of step 17
+    steps = sum(1 for entry in detected[1:-2] if not isinstance(entry, Status))
+    assert steps == 17 + 5 < max_steps
+    assert [str(entry) for entry in detected[:-2]] == [str(entry) for entry in scenario[:len(detected) - 2]]
+    statuses = [entry for entry in detected[:-2] if isinstance(entry, Status)]
+    assert statuses[-1].ranking() in [status.ranking() for status in statuses[:-1]]
+
+
+def test_cycles_are_measured():
+    all_candidates, all_voters, profile = build()
+    rule = LexicographicTieBreakingRule(all_candidates)
+    streams = {'log': None, 'out': io.StringIO()}
+    measurements = run_simulation_alleles(all_candidates, all_voters, Status.from_profile(profile), profile, Random(1),
+                                          streams, rule, BordaUtility(), detect_cycles=True, max_alleles=20)
+
+    # the same alleles, one by one
+    all_candidates, all_voters, profile = build()
+    rand = Random(1)
+    initial_status = Status.from_profile(profile)
+    alleles_cycles = []
+    for allele in range(20):
+        cycles = []
+        run_simulation(all_candidates, all_voters, initial_status, rule, rand, cycles=cycles, log=None,
+                       out=io.StringIO())
+        alleles_cycles.extend(cycles)
+    # some alleles cycle, not all of them
+    assert 0 < len(alleles_cycles) < 20
+    assert measurements.percentage_of_cycles == pytest.approx(len(alleles_cycles) * 100 / 20)
+    assert measurements.average_cycle_entry_step == \
+        pytest.approx(sum(entry for entry, _ in alleles_cycles) / len(alleles_cycles))
+    assert measurements.average_cycle_length == \
+        pytest.approx(sum(length for _, length in alleles_cycles) / len(alleles_cycles))
@@ -0,0 +1,67 @@
+import io
+from collections import Counter
+from random import Random
+
+import pytest
+
+from engine import generate_candidates, generate_voters, run_simulation
+from exact import run_simulation_exact
+from ntu.votes.profilepreference import GeneralProfilePreference
+from ntu.votes.tiebreaking import LexicographicTieBreakingRule, RandomTieBreakingRule
+from ntu.votes.utility import BordaUtility
+from ntu.votes.voter import Status
+
+N_SAMPLES = 2000
+
+
+def build(n_candidates: int, n_voters: int, voter_type: str, seed: int, tie_breaking: str):
+    rand = Random(seed)
+    all_candidates = generate_candidates(n_candidates, False, rand)
+    all_voters = generate_voters(n_voters, voter_type, BordaUtility(), rand)
+    preference = GeneralProfilePreference(rand)
+    for voter in all_voters:
+        voter.build_profile(all_candidates, preference)
+    profile = [voter.getprofile() for voter in all_voters]
+    rule = LexicographicTieBreakingRule(all_candidates) if tie_breaking == 'lexicographic' else RandomTieBreakingRule(rand)
+    return all_candidates, all_voters, profile, rule
+
+
+# profiles with several possible outcomes
+@pytest.mark.parametrize('n_candidates, n_voters, voter_type, seed, tie_breaking', [
+    (6, 10, 'general', 3, 'random'), (6, 10, 'general', 4, 'random')])
+def test_exact_outcomes_match_sampled_runs(n_candidates, n_voters, voter_type, seed, tie_breaking):
+    all_candidates, all_voters, profile, rule = build(n_candidates, n_voters, voter_type, seed, tie_breaking)
+    outcomes = run_simulation_exact(all_candidates, all_voters, Status.from_profile(profile), rule, 10 ** 6)
+    assert outcomes is not None and len(outcomes) > 1
+    assert sum(probability for *_, probability in outcomes) == pytest.approx(1)
+    exact = Counter()
+    exact_steps = 0.0
+    for initial_toppers, final_toppers, converged, steps, probability in outcomes:
+        exact[(frozenset(final_toppers), converged)] += probability
+        exact_steps += steps * probability
+
+    sampled = Counter()
+    sampled_steps = 0.0
+    ballots = [voter.most_recent_vote for voter in all_voters]
+    for sample in range(N_SAMPLES):
+        # every run starts from the initial status and ballots, as the exact engine does
+        for voter, ballot in zip(all_voters, ballots):
+            voter.most_recent_vote = ballot
+            if hasattr(voter, 'abstain'):
+                voter.abstain = False
+        scenario = run_simulation(all_candidates, all_voters, Status.from_profile(profile), rule, Random(sample),
+                                  log=None, out=io.StringIO())
+        sampled[(frozenset(scenario[-2].toppers), scenario[-1])] += 1 / N_SAMPLES
+        sampled_steps += (len(scenario) - 2) / 2 / N_SAMPLES
+
+    total_variation = sum(abs(exact[key] - sampled[key]) for key in set(exact) | set(sampled)) / 2
+    assert total_variation < 0.05
+    assert sampled_steps == pytest.approx(exact_steps, rel=0.05)
+
+
+def test_exact_gives_up_over_max_states():
+    all_candidates, all_voters, profile, rule = build(6, 10, 'general', 4, 'random')
+    ballots = [voter.most_recent_vote for voter in all_voters]
+    assert run_simulation_exact(all_candidates, all_voters, Status.from_profile(profile), rule, 5) is None
+    # the voters are restored
+    assert [voter.most_recent_vote for voter in all_voters] == ballots
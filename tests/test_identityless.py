@@ -0,0 +1,62 @@
+import pytest
+
+from helper import EnumerationCache, count_identityless, generate_identityless, permute_identityless, \
+    unrank_identityless
+
+SIZES = [(n_bins, n_voters) for n_bins in range(1, 8) for n_voters in range(0, 8 if n_bins < 7 else 6)]
+
+
+@pytest.mark.parametrize('n_bins, n_voters', SIZES)
+@pytest.mark.parametrize('mirror', [False, True])
+def test_count_and_unrank_match_the_enumeration(n_bins, n_voters, mirror):
+    bin_names = list(range(n_bins))
+    placements = permute_identityless(bin_names, n_voters, mirror, list())
+    assert count_identityless(n_bins, n_voters, mirror) == len(placements)
+    assert list(generate_identityless(bin_names, n_voters, mirror)) == placements
+    for index, placement in enumerate(placements):
+        assert unrank_identityless(bin_names, n_voters, index, mirror) == placement
+
+
+@pytest.mark.parametrize('n_bins, n_voters', SIZES)
+def test_mirror_rule(n_bins, n_voters):
+    """Without mirror symmetry, exactly one of every placement and its mirror image is kept: the first one met"""
+    bin_names = list(range(n_bins))
+    everything = permute_identityless(bin_names, n_voters, True, list())
+    kept = permute_identityless(bin_names, n_voters, False, list())
+    first_met = []
+    seen = set()
+    for placement in everything:
+        mirror_image = tuple(n_bins - 1 - name for name in reversed(placement))
+        if mirror_image not in seen:
+            first_met.append(placement)
+        seen.add(tuple(placement))
+    assert kept == first_met
+
+
+def test_unrank_out_of_range():
+    count = count_identityless(4, 3)
+    with pytest.raises(IndexError):
+        unrank_identityless(list(range(4)), 3, count)
+    with pytest.raises(IndexError):
+        unrank_identityless(list(range(4)), 3, -1)
+
+
+def test_cache_materializes_once_used_up(tmp_path):
+    bin_names = ['a', 'b', 'c', 'd', 'e']
+    placements = permute_identityless(bin_names, 4, ret=list())
+    cache = EnumerationCache(str(tmp_path))
+    for _ in range(2):
+        for index, placement in enumerate(placements):
+            assert cache.placement(bin_names, 4, index) == placement
+    assert cache.enumerations[(5, 4, False)] is not None
+    # a later run loads the saved enumeration from its first lookup
+    later = EnumerationCache(str(tmp_path))
+    assert later.placement(bin_names, 4, 3) == placements[3]
+    assert (5, 4, False) in later.enumerations
+
+
+def test_cache_unranks_large_enumerations():
+    cache = EnumerationCache(max_placements=10)
+    index = count_identityless(14, 12) - 1
+    assert cache.placement(list(range(14)), 12, index) == unrank_identityless(list(range(14)), 12, index)
+    assert (14, 12, False) not in cache.enumerations
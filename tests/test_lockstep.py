@@ -0,0 +1,48 @@
+import io
+from collections import Counter
+from random import Random
+
+import pytest
+
+from engine import run_simulation
+from lockstep import run_simulation_lockstep
+from ntu.votes.voter import Status
+from tests.test_exact import build
+
+N_SAMPLES = 3000
+
+
+# profiles with several possible outcomes
+@pytest.mark.parametrize('n_candidates, n_voters, voter_type, seed, tie_breaking', [
+    (6, 10, 'general', 4, 'lexicographic'), (6, 10, 'general', 3, 'random'),
+    (6, 10, 'truthful', 3, 'lexicographic'), (6, 10, 'truthful', 3, 'random'),
+    (6, 10, 'lazy', 4, 'lexicographic'), (6, 10, 'lazy', 0, 'random')])
+def test_lockstep_outcomes_match_sequential_runs(n_candidates, n_voters, voter_type, seed, tie_breaking):
+    all_candidates, all_voters, profile, rule = build(n_candidates, n_voters, voter_type, seed, tie_breaking)
+    outcomes = run_simulation_lockstep(all_candidates, all_voters, Status.from_profile(profile), rule, Random(seed),
+                                       N_SAMPLES)
+    assert len(outcomes) == N_SAMPLES
+    lockstep = Counter()
+    lockstep_steps = 0.0
+    for initial_toppers, final_toppers, converged, steps in outcomes:
+        lockstep[(frozenset(final_toppers), converged)] += 1 / N_SAMPLES
+        lockstep_steps += steps / N_SAMPLES
+
+    sampled = Counter()
+    sampled_steps = 0.0
+    ballots = [voter.most_recent_vote for voter in all_voters]
+    for sample in range(N_SAMPLES):
+        # every run starts from the initial status and ballots, as every allele of the lockstep engine does
+        for voter, ballot in zip(all_voters, ballots):
+            voter.most_recent_vote = ballot
+            if hasattr(voter, 'abstain'):
+                voter.abstain = False
+        scenario = run_simulation(all_candidates, all_voters, Status.from_profile(profile), rule, Random(sample),
+                                  log=None, out=io.StringIO())
+        sampled[(frozenset(scenario[-2].toppers), scenario[-1])] += 1 / N_SAMPLES
+        sampled_steps += (len(scenario) - 2) / 2 / N_SAMPLES
+
+    assert len(sampled) > 2
+    total_variation = sum(abs(lockstep[key] - sampled[key]) for key in set(lockstep) | set(sampled)) / 2
+    assert total_variation < 0.06
+    assert lockstep_steps == pytest.approx(sampled_steps, rel=0.05)
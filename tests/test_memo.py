@@ -0,0 +1,40 @@
+import io
+import re
+
+import pytest
+
+from engine import run_all_simulations_per_seed
+
+ARGS = {'--cmin': '3', '--cmax': '5', '--vmin': 'cmin', '--vmax': '8', '--random-search': True, '--utility': 'borda',
+        '--preference': 'single-peaked', '--tiebreakingrule': 'lexicographic', '--voters': 'general', '<BASE>': None,
+        '<EXPO_STEP>': None}
+
+
+def simulate(seed: int, memo_size: int, **options) -> tuple:
+    """The measurements and the scenarios written of one seed, and the memo summary (None without a memo)"""
+    out = io.StringIO()
+    args = {**ARGS, **options, '--memo-size': str(memo_size), 'assigned_seed': seed, 'log': io.StringIO(), 'out': out}
+    measurements = [m.to_bytes() for m in run_all_simulations_per_seed(args)]
+    scenarios, _, memo = out.getvalue().partition('\nBest response memo: ')
+    return measurements, scenarios, re.match(r'(\d+) hits, (\d+) misses \(.*\), (\d+) kept', memo)
+
+
+@pytest.mark.parametrize('options', [
+    {}, {'--tiebreakingrule': 'random'}, {'--voters': 'truthful'}, {'--voters': 'lazy'},
+    {'--preference': 'general'}, {'--utility': 'expo'}, {'--random-search': False, '--voters': 'lazy'}])
+def test_memo_does_not_change_trajectories(options):
+    total_hits = 0
+    for seed in (7, 123, 4567):
+        measurements, scenarios, no_memo = simulate(seed, 0, **options)
+        assert no_memo is None
+        for memo_size in (100_000, 2):
+            memo_measurements, memo_scenarios, memo = simulate(seed, memo_size, **options)
+            assert memo_scenarios == scenarios
+            assert memo_measurements == measurements
+            hits, misses, kept = (int(group) for group in memo.groups())
+            if memo_size == 2:
+                # the least recently used best responses were evicted
+                assert kept == 2 < misses
+            else:
+                total_hits += hits
+    assert total_hits
@@ -0,0 +1,86 @@
+import io
+import pickle
+import sys
+
+import pytest
+
+import engine
+from engine import Measurements, MeasurementStore, pack_measurements, run_all_simulations_per_seed, \
+    unpack_measurements
+
+ARGS = {'--cmin': '3', '--cmax': '4', '--vmin': 'cmin', '--vmax': '6', '--random-search': True, '--utility': 'borda',
+        '--preference': 'single-peaked', '--tiebreakingrule': 'lexicographic', '--voters': 'general', '<BASE>': None,
+        '<EXPO_STEP>': None}
+
+
+def simulate(seeds, **options) -> dict:
+    """{seed: [measurements, ...]} of a small grid"""
+    results = dict()
+    for seed in seeds:
+        args = {**ARGS, **options, 'assigned_seed': seed, 'log': io.StringIO(), 'out': io.StringIO()}
+        results[seed] = run_all_simulations_per_seed(args)
+    return results
+
+
+def signature(measurements: Measurements) -> tuple:
+    return (measurements.to_bytes(), measurements.stable_states_sets, measurements.winning_sets,
+            [(candidate.name, candidate.position, candidate.index) for candidate in measurements.candidates
+             if candidate is not None])
+
+
+def test_pack_round_trip():
+    for options in ({}, {'--tiebreakingrule': 'random'}, {'--random-search': False}, {'--detect-cycles': True}):
+        results = simulate(range(3), **options)
+        unpacked = unpack_measurements(pack_measurements(results))
+        assert list(unpacked) == list(results)
+        for seed in results:
+            assert [signature(m) for m in unpacked[seed]] == [signature(m) for m in results[seed]]
+
+
+def test_pack_nothing():
+    assert unpack_measurements(pack_measurements({})) == {}
+
+
+def test_store_keeps_packed_results():
+    results = simulate(range(4))
+    store = MeasurementStore()
+    store.append(pack_measurements({seed: results[seed] for seed in (0, 1)}))
+    store.append(pack_measurements({seed: results[seed] for seed in (2, 3)}))
+    assert len(store) == 4
+    unpacked = unpack_measurements(store.packed())
+    for seed in results:
+        assert [signature(m) for m in unpacked[seed]] == [signature(m) for m in results[seed]]
+    cell = (3, 4)
+    assert store.column(cell, 'n_voters').tolist() == [4] * 4
+    assert store.column(cell, 'percentage_of_convergence', 1, 3).tolist() == \
+        [results[seed][0].percentage_of_convergence for seed in (1, 2)]
+
+
+def test_bytes_round_trip():
+    for options in ({}, {'--tiebreakingrule': 'random'}, {'--random-search': False}):
+        for measurements in simulate(range(2), **options)[1]:
+            decoded = Measurements.from_bytes(measurements.to_bytes())
+            assert signature(decoded) == signature(measurements)
+            assert signature(pickle.loads(pickle.dumps(measurements))) == signature(measurements)
+            for attr in Measurements.__slots__:
+                if attr != 'candidates':
+                    assert getattr(decoded, attr) == getattr(measurements, attr), attr
+
+
+def test_bytes_of_empty_sets():
+    measurements = Measurements()
+    measurements.n_voters, measurements.n_candidates = 4, 3
+    for attr in ('percentage_of_convergence', 'average_time_to_convergence', 'average_social_welfare',
+                 'percentage_truthful_winner_wins', 'percentage_winner_is_weak_condorcet',
+                 'percentage_winner_is_strong_condorcet'):
+        setattr(measurements, attr, 0.5)
+    decoded = Measurements.from_bytes(measurements.to_bytes())
+    assert decoded.stable_states_sets == decoded.winning_sets == set()
+    assert decoded.to_bytes() == measurements.to_bytes()
+
+
+def test_too_many_candidates_are_rejected(monkeypatch, tmp_path):
+    monkeypatch.setattr(sys, 'argv', ['engine.py', '--comm', 'serial', '--no-graphs', '-o', str(tmp_path / 'out'),
+                                      '-l', str(tmp_path / 'log.txt'), '-C', str(engine.MAX_CANDIDATES + 1)])
+    with pytest.raises(TypeError, match='--cmax'):
+        engine.main()
@@ -0,0 +1,54 @@
+import operator
+from random import Random
+
+import pytest
+
+from engine import generate_candidates
+from ntu.votes.voter import Status
+
+
+class SortedStatus:
+    """The status as it was kept before the frequency buckets: a dict of votes, stable sorted after every move"""
+
+    def __init__(self, votes: list, all_candidates: list):
+        self.votes = {candidate: 0 for candidate in all_candidates}
+        for candidate in votes:
+            self.votes[candidate] += 1
+        self.in_order()
+
+    def in_order(self) -> list:
+        lst = list(self.votes.items())
+        lst.sort(key=operator.itemgetter(1), reverse=True)
+        top_score = lst[0][1]
+        self.toppers = [candidate for (candidate, freq) in lst if freq == top_score]
+        self.runner_ups = [candidate for (candidate, freq) in lst if freq == top_score - 1]
+        self.votes = dict(lst)
+        return lst
+
+    def move(self, frm, to):
+        self.votes[frm] -= 1
+        self.votes[to] += 1
+        self.in_order()
+
+
+@pytest.mark.parametrize('compact', [False, True])
+@pytest.mark.parametrize('seed', range(20))
+def test_buckets_keep_the_stable_sort_order(seed, compact):
+    rand = Random(seed)
+    all_candidates = generate_candidates(rand.randint(2, 7), False, rand)
+    votes = [rand.choice(all_candidates) for _ in range(rand.randint(2, 15))]
+    status = Status.from_votes(votes, all_candidates, compact)
+    reference = SortedStatus(votes, all_candidates)
+    for _ in range(100):
+        assert status.ranking() == reference.in_order()
+        assert status.toppers == reference.toppers
+        assert status.runner_ups == reference.runner_ups
+        frm = rand.choice([candidate for candidate in all_candidates if status.freq(candidate)])
+        to = rand.choice(all_candidates)
+        expected_toppers = status.toppers_after_move(frm, to)
+        status.move(frm, to)
+        if frm != to:
+            reference.move(frm, to)
+        assert status.toppers == expected_toppers
+    copy = status.copy()
+    assert copy.ranking() == status.ranking() and copy.toppers == status.toppers
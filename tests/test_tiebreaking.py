@@ -0,0 +1,18 @@
+from random import Random
+
+from engine import generate_candidates
+from ntu.votes.tiebreaking import FixedPriorityTieBreakingRule, LexicographicTieBreakingRule
+
+
+def test_lexicographic_rule_follows_the_natural_order():
+    rand = Random(0)
+    for trial in range(100):
+        candidates = generate_candidates(rand.randint(2, 7), False, rand)
+        rule = LexicographicTieBreakingRule(rand.sample(candidates, len(candidates)))
+        assert isinstance(rule, FixedPriorityTieBreakingRule)
+        assert rule.priority == {candidate: rank for rank, candidate in enumerate(sorted(candidates))}
+        for _ in range(10):
+            potential_winners = rand.sample(candidates, rand.randint(1, len(candidates)))
+            assert rule.get_winner(potential_winners) == min(potential_winners)
+            assert rule.winning_distribution(potential_winners) == [(min(potential_winners), 1)]
+            assert rule.ordered(potential_winners) == sorted(potential_winners)
@@ -0,0 +1,62 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+__doc__ = """
+Low overhead wall time of the phases of a rank (profile building, dynamics, aggregation, communication, ...) and event
+counters, summarized over all ranks by rank 0.
+"""
+
+
+class PhaseTimers:
+    """Accumulated wall time and number of entries of every phase, and free counters, since the last reset()"""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.entries = defaultdict(int)
+        self.counters = defaultdict(int)
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the body of a with statement. Nested phases are timed in both."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+            self.entries[name] += 1
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] += n
+
+    def snapshot(self) -> dict:
+        """Picklable copy of the timers and counters, to be sent to rank 0 and summarized by summarize()"""
+        return {'seconds': dict(self.seconds), 'entries': dict(self.entries), 'counters': dict(self.counters)}
+
+    def reset(self) -> None:
+        self.seconds.clear()
+        self.entries.clear()
+        self.counters.clear()
+
+
+def summarize(snapshots: list) -> str:
+    """Summary of the snapshots of all ranks: total, min, mean and max time of every phase across ranks, and the total
+    of every counter
+
+    :param snapshots: PhaseTimers.snapshot() of every rank, by rank
+    """
+    phases = sorted({name for snapshot in snapshots for name in snapshot['seconds']})
+    lines = [f'{"phase":<16} {"entries":>9} {"total s":>10} {"min s":>10} {"mean s":>10} {"max s":>10}']
+    for name in phases:
+        seconds = [snapshot['seconds'].get(name, 0.0) for snapshot in snapshots]
+        entries = sum(snapshot['entries'].get(name, 0) for snapshot in snapshots)
+        lines.append(f'{name:<16} {entries:>9} {sum(seconds):>10.3f} {min(seconds):>10.3f} '
+                     f'{sum(seconds) / len(seconds):>10.3f} {max(seconds):>10.3f}')
+    counters = defaultdict(int)
+    for snapshot in snapshots:
+        for name, n in snapshot['counters'].items():
+            counters[name] += n
+    lines.append(', '.join(f'{name} = {n}' for name, n in sorted(counters.items())))
+    if counters['alleles']:
+        lines.append(f'steps per allele = {counters["steps"] / counters["alleles"]:.2f}')
+    return '\n'.join(lines)